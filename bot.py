@@ -1,5 +1,6 @@
 import os
 
+import aiohttp
 import discord
 import redis.asyncio as redis
 from discord.ext import commands
@@ -13,7 +14,17 @@ from commands.misc import MiscCommandCog
 from commands.moderation import ModerationCommandGroup
 from commands.rating import RatingCommandGroup
 from commands.activity import ActivityCommandGroup
+from utils.avatar_service import AvatarService
 from utils.backup import BackupCog
+from utils.emoji_cache import EmojiCache
+from utils.guild_index import GuildIndex, GuildIndexCog
+from utils.json_db import close_all_stores
+from utils.log_sink import LogSink
+from utils.rating_db import RatingDB
+from utils.render_cache import RenderCache
+from utils.render_executor import RenderExecutor
+from utils.render_scheduler import RenderScheduler
+from utils.tag_store import open_tag_store
 from events import Events
 
 load_dotenv()
@@ -23,23 +34,50 @@ PRIMARY_GUILD_ID = os.getenv("PRIMARY_GUILD")
 PRIMARY_GUILD = discord.Object(id=PRIMARY_GUILD_ID)
 TOKEN = os.getenv("DISCORD_TOKEN")
 ENV = os.getenv("ENV")
+HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "20"))
 
 
 class DegeneBot(commands.Bot):
     def __init__(self, intents: Intents, activity: discord.Activity = None) -> None:
         super().__init__(command_prefix="!", intents=intents, activity=activity)
+        self.render_executor = RenderExecutor.from_env()
+        self.render_cache = RenderCache.from_env()
+        self.render_scheduler = RenderScheduler.from_env()
+        self.avatar_service = AvatarService()
+        self.guild_index = GuildIndex()
+        self.log_sink = LogSink.from_env()
+        self.rating_db = RatingDB.from_env()
+        self.http_session: aiohttp.ClientSession = None
+        self.emoji_cache: EmojiCache = None
+        self.redis_client: redis.Redis = None
+        self.tag_store = None
 
     async def setup_hook(self):
-        redis_client = redis.Redis(host="localhost", port=6379, decode_responses=True)
+        # One pooled session for non-gateway HTTP (emoji CDN etc.)
+        self.http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=HTTP_POOL_LIMIT, limit_per_host=HTTP_POOL_LIMIT // 2
+            ),
+            timeout=aiohttp.ClientTimeout(total=15),
+        )
+        self.emoji_cache = EmojiCache(self.http_session)
+        await self.render_executor.start()
+        self.log_sink.start()
+        await self.rating_db.open()
+        self.redis_client = redis.Redis(
+            host="localhost", port=6379, decode_responses=True
+        )
         try:
-            await redis_client.ping()
+            await self.redis_client.ping()
         except Exception as e:
             print("Could not connect to Redis:", e)
             if ENV == "prod":
                 exit(1)
+        self.tag_store = await open_tag_store(self.redis_client)
+        await self.add_cog(GuildIndexCog(self, self.guild_index))
         await self.add_cog(Events(self))
         await self.add_cog(MiscCommandCog(self))
-        await self.add_cog(BackupCog(self, redis_client))
+        await self.add_cog(BackupCog(self, self.redis_client))
 
         self.tree.add_command(AssignRoleCommandGroup(self))
         self.tree.add_command(TagSystemGroup(self))
@@ -54,12 +92,25 @@ class DegeneBot(commands.Bot):
             self.tree.copy_global_to(guild=PRIMARY_GUILD)
             await self.tree.sync(guild=PRIMARY_GUILD)
 
+    async def close(self):
+        self.render_executor.shutdown()
+        await self.log_sink.close()
+        await close_all_stores()
+        await self.rating_db.close()
+        if self.tag_store is not None:
+            await self.tag_store.close()
+        await super().close()
+        if self.http_session is not None:
+            await self.http_session.close()
 
-logging_handler = setup_logging()
 
-bot_activity = discord.Activity(
-    type=discord.ActivityType.watching, name="for degen activity."
-)
-bot = DegeneBot(intents=discord.Intents.all(), activity=bot_activity)
+# Guarded so render worker processes can re-import this module without starting a second bot
+if __name__ == "__main__":
+    logging_handler = setup_logging()
 
-bot.run(TOKEN, log_handler=None)
+    bot_activity = discord.Activity(
+        type=discord.ActivityType.watching, name="for degen activity."
+    )
+    bot = DegeneBot(intents=discord.Intents.all(), activity=bot_activity)
+
+    bot.run(TOKEN, log_handler=None)
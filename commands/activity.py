@@ -1,7 +1,5 @@
-import json
-import os
-
-from typing import Dict, List
+from collections import Counter
+from typing import List
 
 import discord
 from discord import ui
@@ -9,30 +7,38 @@ from discord.ui import View
 from discord import app_commands
 from discord.ext import commands
 
+from utils.autocomplete import AutocompleteIndex
+from utils.json_db import open_store
+
 
 @app_commands.guild_only()
 class ActivityCommandGroup(app_commands.Group, name="activity"):
     def __init__(self, bot: commands.Bot):
         self.act_json_path = "json/activity.json"
-        try:
-            self.act_dict = self.load_acts()
-        except json.decoder.JSONDecodeError:
-            self.act_dict = {}
-        except FileNotFoundError:
-            self.act_dict = {}
-            if not os.path.exists("json"):
-                os.makedirs("json")
-            os.close(os.open(self.act_json_path, os.O_CREAT))
+        self.act_dict = open_store(self.act_json_path, indent=4)
+        # Every activity name across users, with how many users partake in it
+        self.act_members = Counter(
+            act for acts in self.act_dict.values() for act in set(acts)
+        )
+        self.act_index = AutocompleteIndex(self.act_members)
         self.bot = bot
         super().__init__()
 
-    def load_acts(self) -> Dict[str, Dict]:
-        with open(self.act_json_path, "r", encoding="utf-8") as disk_lib:
-            return json.loads(disk_lib.read())
-
-    def dump_acts(self) -> None:
-        with open(self.act_json_path, "w", encoding="utf-8") as disk_lib:
-            disk_lib.write(json.dumps(self.act_dict, sort_keys=True, indent=4))
+    def set_activities(self, user: str, acts: List[str]) -> None:
+        old = set(self.act_dict.get(user, ()))
+        if acts:
+            self.act_dict.set(user, acts)
+        else:
+            self.act_dict.delete(user)
+        for act in old.difference(acts):
+            self.act_members[act] -= 1
+            if not self.act_members[act]:
+                del self.act_members[act]
+                self.act_index.remove(act)
+        for act in set(acts).difference(old):
+            self.act_members[act] += 1
+            self.act_index.add(act)
+            self.act_index.record_use(act)
 
     @app_commands.command(
         name="enumerate",
@@ -74,12 +80,7 @@ class ActivityCommandGroup(app_commands.Group, name="activity"):
         class MemberSelect(View):
             def add_activity(self, users, tname):
                 for user in users:
-                    if user not in oself.act_dict:
-                        oself.act_dict[user] = [tname]
-                    else:
-                        oself.act_dict[user].append(tname)
-
-                oself.dump_acts()
+                    oself.set_activities(user, [*oself.act_dict.get(user, []), tname])
 
             @ui.select(
                 cls=ui.UserSelect,
@@ -156,16 +157,14 @@ class ActivityCommandGroup(app_commands.Group, name="activity"):
     async def activity_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> List[app_commands.Choice[str]]:
-        choices = set()
         user = interaction.user.global_name
         if user not in self.act_dict:
             return []
-        for act in self.act_dict[interaction.user.global_name]:
-            choices.add(act)
         return [
             app_commands.Choice(name=choice, value=choice)
-            for choice in choices
-            if current.lower() in choice.lower()
+            for choice in self.act_index.search(
+                current, 25, allowed=set(self.act_dict[user])
+            )
         ]
 
     @app_commands.command(
@@ -185,10 +184,9 @@ class ActivityCommandGroup(app_commands.Group, name="activity"):
             await interaction.response.send_message(
                 f"You do not currently partake in {activity}.", ephemeral=True
             )
-        self.act_dict[user].remove(activity)
-        if len(self.act_dict[user]) == 0:
-            self.act_dict.pop(user)
-        self.dump_acts()
+        self.set_activities(
+            user, [act for act in self.act_dict[user] if act != activity]
+        )
         await interaction.response.send_message(
             f"You no longer partake in {activity}.", ephemeral=True
         )
@@ -201,11 +199,14 @@ class ActivityCommandGroup(app_commands.Group, name="activity"):
     async def rename_activity(
         self, interaction: discord.Interaction, activity: str, new_name: str
     ):
-        for user in self.act_dict:
-            for i in range(len(self.act_dict[user])):
-                if self.act_dict[user][i] == activity:
-                    self.act_dict[user][i] = new_name
+        if activity in self.act_members and new_name not in self.act_index:
+            # Carry the old name's ranking over instead of starting fresh
+            self.act_index.rename(activity, new_name)
+        for user, acts in self.act_dict.snapshot().data.items():
+            if activity in acts:
+                self.set_activities(
+                    user, [new_name if act == activity else act for act in acts]
+                )
         await interaction.response.send_message(
             f"Renamed {activity} to {new_name} for all users.", ephemeral=True
         )
-        self.dump_acts()
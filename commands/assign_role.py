@@ -7,6 +7,8 @@ from dotenv import load_dotenv
 
 from typing import Dict, List
 
+from utils.autocomplete import AutocompleteIndex
+
 
 @app_commands.guild_only()
 class AssignRoleCommandGroup(app_commands.Group, name="assign-role"):
@@ -21,16 +23,15 @@ class AssignRoleCommandGroup(app_commands.Group, name="assign-role"):
             "Movie Enthusiast",
             "Book Worm",
         )
+        self.ping_index = AutocompleteIndex(self.PingRoles)
         super().__init__()
 
     async def news_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> List[app_commands.Choice[str]]:
-        choices = self.PingRoles
         return [
             app_commands.Choice(name=choice, value=choice)
-            for choice in choices
-            if current.lower() in choice.lower()
+            for choice in self.ping_index.search(current, 25)
         ]
 
     @app_commands.command(
@@ -42,14 +43,11 @@ class AssignRoleCommandGroup(app_commands.Group, name="assign-role"):
     @app_commands.rename(choice="role")
     async def assign_ping_role(self, interaction: discord.Interaction, choice: str):
         user = interaction.user
-        role_scuffed = interaction.guild.roles
-        roles = {}
-        # guild.roles returns a scuffed object class so we convert it to dict for ease of use
-        for x in role_scuffed:
-            roles[x.name] = x.id
-        if choice in roles:
+        guild_ping_role = self.bot.guild_index.role(interaction.guild, choice)
+        if guild_ping_role is not None:
             ping_role = choice
-            ping_role_id = roles[choice]
+            ping_role_id = guild_ping_role.id
+            self.ping_index.record_use(choice)
         else:
             print(
                 f"Server {interaction.guild} not configured to accept choice {choice}!"
@@ -68,7 +66,6 @@ class AssignRoleCommandGroup(app_commands.Group, name="assign-role"):
             return
 
         # Assign the new ping role to the user
-        guild_ping_role = interaction.guild.get_role(ping_role_id)
         await user.add_roles(guild_ping_role, reason="Assigning new ping role")
 
         await interaction.response.send_message(
@@ -1,16 +1,20 @@
 import asyncio
 import hashlib
+import io
+import logging
 import os
 import random
 from typing import Optional
 
-from PIL import Image, ImageSequence
 import discord
 from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 
-from utils import log_utils
+from utils import compositing, log_utils
+from utils.render_cache import RenderCache
+from utils.render_executor import RenderTimeout
+from utils.render_scheduler import RenderBusy
 
 
 @app_commands.guild_only()
@@ -18,8 +22,7 @@ class MiscCommandCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         load_dotenv()
         self.bot = bot
-        self.mobile_path = "images/MobileDiscord.png"
-        self.embed_path = "images/EmbedDiscord.png"
+        self.logger = logging.getLogger("bot")
         self.log_channel = "degen-log"
         self.quote_channel = 472148805127634954
         self.degen_channel = os.getenv("DEGEN_CHANNEL_ID")
@@ -68,10 +71,7 @@ class MiscCommandCog(commands.Cog):
     async def quote_submit(self, interaction: discord.Interaction, link: str):
         msg = link.split("/")
         guild = interaction.guild
-        quotes_channel = discord.utils.find(
-            lambda channel: channel.id == self.quote_channel,
-            guild.channels,
-        )
+        quotes_channel = guild.get_channel(self.quote_channel)
         if quotes_channel is None:
             raise Exception("Quotes channel not found")
         channel_id = int(msg[5])
@@ -103,53 +103,14 @@ class MiscCommandCog(commands.Cog):
             fn = str(user.id) + ".gif"
         else:
             fn = str(user.id) + ".png"
-        await avatar.save(fn)
-        await interaction.response.send_message(file=discord.File(fn), ephemeral=ephem)
-        if os.path.exists(fn):
-            os.remove(fn)
-        else:
-            print(f"Error occurred when deleting file:\t{fn}")
+        data = io.BytesIO(await self.bot.avatar_service.read(avatar, 1024))
+        await interaction.response.send_message(
+            file=discord.File(data, filename=fn), ephemeral=ephem
+        )
 
     @app_commands.command(name="mobile")
     async def mobile_image(self, interaction: discord.Interaction, user: discord.User):
-        avatar = user.display_avatar
-        fn = str(user.id) + "_temp"
-        fn_o = "mobile_output.gif"
-        frame_list = []
-        await avatar.save(fn)
-        with Image.open(fn) as im:
-            idx = 1
-            duration = 0
-
-            for frame in ImageSequence.Iterator(im):
-                frame_list.append(self.build_frame(frame, self.mobile_path))
-                idx += 1
-                try:
-                    duration += im.info["duration"]
-                except KeyError:
-                    continue
-
-            frame_duration = int(idx / duration) if duration > 0 else 1000
-
-        frame_list[0].save(
-            fn_o,
-            save_all=True,
-            append_images=frame_list[1:],
-            optimize=False,
-            duration=frame_duration,
-            loop=0,
-        )
-
-        await interaction.response.send_message(file=discord.File(fp=fn_o))
-
-        if os.path.exists(fn):
-            os.remove(fn)
-        else:
-            print(f"Error occurred when deleting file:\t{fn}")
-        if os.path.exists(fn_o):
-            os.remove(fn_o)
-        else:
-            print(f"Error occurred when deleting file:\t{fn_o}")
+        await self.send_template_meme(interaction, user, "mobile")
 
     @app_commands.command(name="rr")
     async def rachael_response(self, interaction: discord.Interaction):
@@ -299,50 +260,70 @@ class MiscCommandCog(commands.Cog):
 
     @app_commands.command(name="embed")
     async def embed_image(self, interaction: discord.Interaction, user: discord.User):
-        avatar = user.display_avatar
-        fn = str(user.id) + "_temp"
-        fn_o = "embed_output.gif"
-        frame_list = []
-        await avatar.save(fn)
-        with Image.open(fn) as im:
-            idx = 1
-            duration = 0
+        await self.send_template_meme(interaction, user, "embed")
 
-            for frame in ImageSequence.Iterator(im):
-                frame_list.append(self.build_frame(frame, self.embed_path))
-                idx += 1
-                try:
-                    duration += im.info["duration"]
-                except KeyError:
-                    continue
+    async def send_template_meme(
+        self, interaction: discord.Interaction, user: discord.User, template: str
+    ):
+        # Rendering can take a while for animated avatars, so acknowledge first
+        await interaction.response.defer()
+        avatar = user.display_avatar
+        key = RenderCache.make_key(compositing.RENDER_TAG, avatar.key, template)
 
-            frame_duration = int(idx / duration) if duration > 0 else 1000
+        async def render():
+            data = await self.bot.avatar_service.read(
+                avatar, compositing.SPECS[template].avatar_size
+            )
+            result = await self.bot.render_executor.run(
+                compositing.render_meme, template, avatar.key, data
+            )
+            self.logger.info(f"Rendered {template} for {user.id}: {result.describe()}")
+            return result.data
 
-        frame_list[0].save(
-            fn_o,
-            save_all=True,
-            append_images=frame_list[1:],
-            optimize=False,
-            duration=frame_duration,
-            loop=0,
+        try:
+            output = await self.bot.render_cache.get_or_render(
+                key,
+                lambda: self.bot.render_scheduler.submit(
+                    key, interaction.user.id, render
+                ),
+            )
+        except RenderBusy as error:
+            await interaction.followup.send(str(error), ephemeral=True)
+            return
+        except RenderTimeout:
+            await interaction.followup.send(
+                "That avatar took too long to render, sorry!", ephemeral=True
+            )
+            return
+        await interaction.followup.send(
+            file=discord.File(
+                io.BytesIO(output),
+                filename=f"{template}_output.{compositing.OUTPUT_EXTENSION}",
+            )
         )
 
-        await interaction.response.send_message(file=discord.File(fp=fn_o))
-
-        if os.path.exists(fn):
-            os.remove(fn)
-        else:
-            print(f"Error occurred when deleting file:\t{fn}")
-        if os.path.exists(fn_o):
-            os.remove(fn_o)
-        else:
-            print(f"Error occurred when deleting file:\t{fn_o}")
-
-    def build_frame(self, icon, path):
-        mobile_discord = Image.open(path)
-        iresize = icon.resize((43, 43), Image.LANCZOS)
-        x1, y1 = 221, 148
-        x2, y2 = 264, 191
-        mask = iresize.convert("RGBA")
-        mobile_discord.paste(iresize, (x1, y1, x2, y2), mask)
-        return mobile_discord
+    @app_commands.command(
+        name="render_stats", description="Show render cache and executor counters."
+    )
+    @app_commands.checks.has_any_role("Actual Admin")
+    async def render_stats(self, interaction: discord.Interaction):
+        stats = {
+            "Cache": self.bot.render_cache.stats(),
+            "Avatars": self.bot.avatar_service.stats(),
+            "Scheduler": self.bot.render_scheduler.stats(),
+            "Emoji": self.bot.emoji_cache.stats(),
+            "Log sink": self.bot.log_sink.stats(),
+        }
+        events = self.bot.get_cog("Events")
+        if events is not None:
+            stats["Reaction votes"] = events.reaction_votes.stats()
+            stats["Message store"] = events.message_store.stats()
+        lines = [f"Executor: {self.bot.render_executor.kind}"]
+        for label, counters in stats.items():
+            lines.append(
+                f"{label}: "
+                + ", ".join(f"{name}={value}" for name, value in counters.items())
+            )
+        await interaction.response.send_message(
+            "```\n" + "\n".join(lines) + "\n```", ephemeral=True
+        )
@@ -1,7 +1,7 @@
 from datetime import datetime, timedelta, timezone
+import io
 import json
 import logging
-import os
 import asyncio
 from typing import Dict
 
@@ -57,14 +57,9 @@ class ModerationCommandGroup(app_commands.Group, name="moderation"):
     ):
         await interaction.response.defer(ephemeral=True, thinking=True)
 
-        channel = ""
-        cat = ""
-
-        for ch in interaction.guild.channels:
-            if ch.name == channel_name:
-                channel = ch
-            elif ch.name == category_name:
-                cat = ch
+        entities = self.bot.guild_index.get(interaction.guild)
+        channel = entities.channel(channel_name)
+        cat = entities.category(category_name)
         if not channel:
             await interaction.followup.send(
                 f"Could not identify channel with name: {channel_name}."
@@ -105,13 +100,10 @@ class ModerationCommandGroup(app_commands.Group, name="moderation"):
         if len(ret) < 2000:
             await interaction.response.send_message(ret, ephemeral=True)
         else:
-            fn = "out.txt"
-            with open(fn, "w") as f:
-                f.write(ret)
             await interaction.response.send_message(
-                file=discord.File(fn), ephemeral=True
+                file=discord.File(io.BytesIO(ret.encode("utf-8")), filename="out.txt"),
+                ephemeral=True,
             )
-            os.unlink(fn)
 
     @app_commands.command(
         name="range-delete",
@@ -1,126 +1,29 @@
 import ast
 import base64
-import sys
-from decimal import Decimal
-import os
+import io
 import json
-from typing import Dict, List, Optional
+from typing import List, Optional
 
 import discord
 from discord import ui
 from discord import app_commands
 from discord.ext import commands
 
+from utils.rating_db import FIELDS, RatingDB
+
 import matplotlib.pyplot as plt
 
 
 @app_commands.guild_only()
 class RatingCommandGroup(app_commands.Group, name="rating"):
     def __init__(self, bot: commands.Bot):
-        self.rating_json_path = "json/ratings.json"
-        try:
-            self.rating_dict = self.load_ratings()
-        except json.decoder.JSONDecodeError:
-            self.rating_dict = {}
-        except FileNotFoundError:
-            self.rating_dict = {}
-            if not os.path.exists("json"):
-                os.makedirs("json")
-            os.close(os.open(self.rating_json_path, os.O_CREAT))
         self.bot = bot
         self.rating_channel_name = "music-rating-submissions"
-        self.fconv = {
-            "Instrumentals": "avg_ins",
-            "Vocals": "avg_voc",
-            "Lyrics": "avg_lyr",
-            "Emotion/Feeling": "avg_emo",
-            "Overall": "avg_ovr",
-        }
         super().__init__()
 
-    def recompute_averages(self, content):
-        num = ins = voc = lyr = emo = ovr = 0
-        if len(self.rating_dict.get(content).get("ratings")) == 0:
-            return
-        for keys, values in self.rating_dict.get(content).get("ratings").items():
-            ins += (
-                int(values["Instrumentals"])
-                if values["Instrumentals"] != "N/A"
-                else ins / num
-                if num > 0
-                else 0
-            )
-            voc += (
-                int(values["Vocals"])
-                if values["Vocals"] != "N/A"
-                else voc / num
-                if num > 0
-                else 0
-            )
-            lyr += (
-                int(values["Lyrics"])
-                if values["Lyrics"] != "N/A"
-                else lyr / num
-                if num > 0
-                else 0
-            )
-            emo += (
-                int(values["Emotion/Feeling"])
-                if values["Emotion/Feeling"] != "N/A"
-                else emo / num
-                if num > 0
-                else 0
-            )
-            ovr += int(values["Overall"])
-            num += 1
-        self.rating_dict[content]["avg_ins"] = str(
-            min(Decimal(ins) / Decimal(num), Decimal(5))
-        )
-        self.rating_dict[content]["avg_voc"] = str(
-            min(Decimal(voc) / Decimal(num), Decimal(5))
-        )
-        self.rating_dict[content]["avg_lyr"] = str(
-            min(Decimal(lyr) / Decimal(num), Decimal(5))
-        )
-        self.rating_dict[content]["avg_emo"] = str(
-            min(Decimal(emo) / Decimal(num), Decimal(5))
-        )
-        self.rating_dict[content]["avg_ovr"] = str(
-            min(Decimal(ovr) / Decimal(num), Decimal(20))
-        )
-
-    def get_comments(self, content):
-        com = []
-        for keys, values in self.rating_dict.get(content).get("ratings").items():
-            if values["Comments"]:
-                com.append(values["Comments"])
-        return com
-
-    def get_highest_field(self, field: str) -> (str, Decimal):
-        hk = ""
-        hv = 0
-        for key, values in self.rating_dict.items():
-            if Decimal(values[field]) > Decimal(hv):
-                hk = key
-                hv = values[field]
-        return hk, hv
-
-    def get_lowest_field(self, field: str) -> (str, Decimal):
-        hk = ""
-        hv = sys.maxsize
-        for key, values in self.rating_dict.items():
-            if Decimal(values[field]) < Decimal(hv):
-                hk = key
-                hv = values[field]
-        return hk, hv
-
-    def load_ratings(self) -> Dict[str, Dict]:
-        with open(self.rating_json_path, "r", encoding="utf-8") as disk_lib:
-            return json.loads(disk_lib.read())
-
-    def dump_ratings(self) -> None:
-        with open(self.rating_json_path, "w", encoding="utf-8") as disk_lib:
-            disk_lib.write(json.dumps(self.rating_dict, sort_keys=True, indent=4))
+    @property
+    def db(self) -> RatingDB:
+        return self.bot.rating_db
 
     def wrap_words(self, text: str, k: int = 3, *, sep: str = None) -> str:
         text = text.strip().split(sep)
@@ -157,28 +60,84 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     @app_commands.command(name="stats")
     @app_commands.autocomplete(field=field_autocomplete, extreme=type_autocomplete)
     async def stats(self, interaction: discord.Interaction, extreme: str, field: str):
-        if extreme == "Highest":
-            ret = self.get_highest_field(self.fconv[field])
-        else:
-            ret = self.get_lowest_field(self.fconv[field])
+        if field not in FIELDS:
+            await interaction.response.send_message(
+                f"`{field}` is not a rating field.", ephemeral=True
+            )
+            return
+        ret = self.db.ranked(field, 1, highest=extreme == "Highest")
+        if not ret:
+            await interaction.response.send_message(
+                "Nothing has been rated yet.", ephemeral=True
+            )
+            return
+        await interaction.response.send_message(
+            f"The submission with the {extreme.lower()} `{field}` score is `{ret[0].name}` at `{ret[0].score:.2f}`!"
+        )
+
+    async def send_standings(
+        self,
+        interaction: discord.Interaction,
+        field: str,
+        count: int,
+        min_votes: int,
+        highest: bool,
+    ):
+        if field not in FIELDS:
+            await interaction.response.send_message(
+                f"`{field}` is not a rating field.", ephemeral=True
+            )
+            return
+        standings = self.db.ranked(field, count, highest, min_votes)
+        if not standings:
+            await interaction.response.send_message(
+                f"No submission has {min_votes} or more `{field}` ratings yet.",
+                ephemeral=True,
+            )
+            return
+        lines = [
+            f"{place}. `{standing.name}`: {standing.score:.2f} ({standing.votes} votes)"
+            for place, standing in enumerate(standings, start=1)
+        ]
+        nl = "\n"
         await interaction.response.send_message(
-            f"The submission with the {extreme.lower()} `{field}` score is `{ret[0]}` at `{ret[1]}`!"
+            f"{'Top' if highest else 'Bottom'} {len(standings)} by `{field}`:\n{nl.join(lines)}"
         )
 
+    @app_commands.command(
+        name="top", description="The highest rated submissions for a field."
+    )
+    @app_commands.autocomplete(field=field_autocomplete)
+    async def top(
+        self,
+        interaction: discord.Interaction,
+        field: str,
+        count: app_commands.Range[int, 1, 25] = 10,
+        min_votes: app_commands.Range[int, 1] = 1,
+    ):
+        await self.send_standings(interaction, field, count, min_votes, highest=True)
+
+    @app_commands.command(
+        name="bottom", description="The lowest rated submissions for a field."
+    )
+    @app_commands.autocomplete(field=field_autocomplete)
+    async def bottom(
+        self,
+        interaction: discord.Interaction,
+        field: str,
+        count: app_commands.Range[int, 1, 25] = 10,
+        min_votes: app_commands.Range[int, 1] = 1,
+    ):
+        await self.send_standings(interaction, field, count, min_votes, highest=False)
+
     async def rating_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> List[app_commands.Choice[str]]:
-        choices = [*self.rating_dict]
-        ratings = [
+        # Discord autocomplete only supports 25 elements
+        return [
             app_commands.Choice(name=choice, value=choice)
-            for choice in choices
-            if current.lower() in choice.lower()
+            for choice in self.db.index.search(current, 25)
         ]
-        if len(ratings) > 25:
-            return ratings[:25]
-            # Discord autocomplete only supports 25 elements
-            # Without this, users are not shown any elements of the tag list when total tags > 25
-        return ratings
 
     @app_commands.command(
         name="new",
@@ -189,14 +148,13 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     ):
         name_clean = name.strip()
         content_clean = content.strip()
-        if name_clean in self.rating_dict:
+        if await self.db.exists(name_clean):
             await interaction.response.send_message(
                 f"Tag `{name_clean}` already exists!", ephemeral=True
             )
             return
-        rating_channel = discord.utils.find(
-            lambda channel: channel.name == self.rating_channel_name,
-            interaction.guild.channels,
+        rating_channel = self.bot.guild_index.channel(
+            interaction.guild, self.rating_channel_name
         )
         if rating_channel is None:
             raise Exception("Music Rating channel not found")
@@ -205,16 +163,7 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
             f"\n\t\t{content_clean}"
             f"\nTo rate this content, please use the `/rating submit {name_clean}` command."
         )
-        self.rating_dict[name_clean] = {
-            "content": content_clean,
-            "ratings": {},
-            "avg_ins": 0,
-            "avg_voc": 0,
-            "avg_lyr": 0,
-            "avg_emo": 0,
-            "avg_ovr": 0,
-        }
-        self.dump_ratings()
+        await self.db.add_submission(name_clean, content_clean)
         await interaction.response.send_message(
             f"`{name_clean}` has been submitted for review by your peers. See {msg.jump_url}",
             ephemeral=True,
@@ -241,18 +190,19 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
         self, interaction: discord.Interaction, content: str, hidden: Optional[str]
     ):
         newline = "\n\t"
+        comments = await self.db.comments(content)
         if hidden:
             await interaction.response.send_message(
                 f"Here is what people are saying about {content}:"
                 f"\n\n\t"
-                f"{newline.join(self.get_comments(content))}",
+                f"{newline.join(comments)}",
                 ephemeral=ast.literal_eval(hidden),
             )
         else:
             await interaction.response.send_message(
                 f"Here is what people are saying about {content}:"
                 f"\n\n\t"
-                f"{newline.join(self.get_comments(content))}"
+                f"{newline.join(comments)}"
             )
 
     @app_commands.command(
@@ -327,32 +277,34 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
                 overall += vals[i]
             except ValueError:  # value was a str
                 vals[i] = "N/A"
-        self.rating_dict[content]["ratings"][str(interaction.user.name)] = {
-            "Instrumentals": vals[0],
-            "Vocals": vals[1],
-            "Lyrics": vals[2],
-            "Emotion/Feeling": vals[3],
-            "Overall": overall,
-            "Comments": rm.com.value,
-        }
-        self.recompute_averages(content)
-        self.dump_ratings()
+        if await self.db.rate(
+            content,
+            interaction.user.id,
+            str(interaction.user.name),
+            [None if val == "N/A" else val for val in vals],
+            overall,
+            rm.com.value,
+        ):
+            self.db.index.record_use(content)
 
     @app_commands.command(name="download")
     async def download(self, interaction: discord.Interaction):
-        self.dump_ratings()
+        data = json.dumps(await self.db.export(), sort_keys=True, indent=4)
         await interaction.response.send_message(
-            file=discord.File("json/ratings.json"), ephemeral=True
+            file=discord.File(
+                io.BytesIO(data.encode("utf-8")), filename="ratings.json"
+            ),
+            ephemeral=True,
         )
 
     @app_commands.command(name="averages")
     @app_commands.autocomplete(content=rating_autocomplete)
     async def averages(self, interaction: discord.Interaction, content: str):
-        k = self.rating_dict.get(content)
-        ins = k["avg_ins"]
-        voc = k["avg_voc"]
-        lyr = k["avg_lyr"]
-        emo = k["avg_emo"]
+        k = await self.db.averages(content)
+        ins = f"{k['Instrumentals']:.2f}"
+        voc = f"{k['Vocals']:.2f}"
+        lyr = f"{k['Lyrics']:.2f}"
+        emo = f"{k['Emotion/Feeling']:.2f}"
         await interaction.response.send_message(
             f"{content} has average ratings as follows:\n"
             f"\t**Instrumentals**:\t{ins}\n"
@@ -370,8 +322,7 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
                 "Sorry, Jared, I do not trust you to not delete TSwift submissions as they appear."
             )
             return
-        self.rating_dict.pop(content, None)
-        self.dump_ratings()
+        await self.db.drop(content)
         await interaction.response.send_message(
             f"{content} has been dropped from the rating JSON successfully.",
             ephemeral=True,
@@ -382,9 +333,9 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     async def graph(self, interaction: discord.Interaction, field: str):
         keys = []
         vals = []
-        for k, v in self.rating_dict.items():
+        for k, v in await self.db.field_scores(field):
             keys.append(self.wrap_words(k))
-            vals.append(float(v[self.fconv[field]]))
+            vals.append(v)
         plt.bar(keys, vals)
         plt.suptitle(f"{field} Ratings")
         if field == "Overall":
@@ -393,17 +344,19 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
             plt.ylim(0, 5)
         plt.xticks(list(range(0, len(keys), 1)), keys, rotation=45)
         plt.tight_layout()
-        fn = "graph_output.png"
-        plt.savefig(fname=fn)
-        await interaction.response.send_message(file=discord.File(fn))
-        os.unlink(fn)
+        buffer = io.BytesIO()
+        plt.savefig(buffer, format="png")
+        plt.close()
+        buffer.seek(0)
+        await interaction.response.send_message(
+            file=discord.File(buffer, filename="graph_output.png")
+        )
 
     @app_commands.command(name="list")
     async def content_list(self, interaction: discord.Interaction):
         merge = []
         nl = "\n"
-        for k, v in self.rating_dict.items():
-            l = v["content"]
+        for k, l in await self.db.listing():
             merge.append(f"[{k}](<{l}>)")
         await interaction.response.send_message(f"{nl.join(merge)}")
 
@@ -411,10 +364,8 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     async def todo(self, interaction: discord.Interaction):
         merge = []
         nl = "\n"
-        for k, v in self.rating_dict.items():
-            if interaction.user.name not in v["ratings"]:
-                l = v["content"]
-                merge.append(f"[{k}](<{l}>)")
+        for k, l in await self.db.todo(interaction.user.id, interaction.user.name):
+            merge.append(f"[{k}](<{l}>)")
         if len(merge) == 0:
             await interaction.response.send_message(
                 f"{interaction.user.mention}, you have rated all submitted content. Nicely done!",
@@ -429,10 +380,22 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     @app_commands.command(name="recompute")
     @app_commands.checks.has_any_role("Actual Admin")
     async def force_recompute(self, interaction: discord.Interaction):
-        for k, v in self.rating_dict.items():
-            self.recompute_averages(k)
+        drift = await self.db.verify()
+        if not drift:
+            await interaction.response.send_message(
+                "All running averages match their ratings.", ephemeral=True
+            )
+            return
+        lines = [
+            f"`{name}` {field}: stored {stored[0]}/{stored[1]}, actual {actual[0]}/{actual[1]}"
+            for name, field, stored, actual in drift
+        ]
+        report = "\n".join(lines)
+        if len(report) > 1900:
+            report = report[:1900] + "\n..."
         await interaction.response.send_message(
-            "Averages have been recalculated.", ephemeral=True
+            f"Corrected {len(drift)} drifted totals (sum/count):\n{report}",
+            ephemeral=True,
         )
 
     @app_commands.command(
@@ -442,13 +405,12 @@ class RatingCommandGroup(app_commands.Group, name="rating"):
     @app_commands.checks.has_any_role("Actual Admin")
     @app_commands.autocomplete(content=rating_autocomplete)
     async def rename(self, interaction: discord.Interaction, content: str, name: str):
-        if name in self.rating_dict.keys():
+        if await self.db.exists(name):
             await interaction.response.send_message(
                 f"{name} is already in use by another submission!"
             )
             return
-        if content in self.rating_dict.keys():
-            self.rating_dict[name] = self.rating_dict.pop(content)
+        if await self.db.rename(content, name):
             await interaction.response.send_message(
                 f"{content} has successfully been renamed to {name}!"
             )
@@ -1,8 +1,5 @@
-import base64
-import copy
 import os
-import json
-from typing import Dict, List
+from typing import List
 
 import discord
 from discord.ui import Button
@@ -10,60 +7,41 @@ from discord import app_commands
 from discord.ext import commands
 from dotenv import load_dotenv
 
+from utils.tag_store import Tag
+
 
 @app_commands.guild_only()
 class TagSystemGroup(app_commands.Group, name="tag"):
     def __init__(self, bot: commands.Bot):
         load_dotenv()
-        self.tag_json_path = os.getenv("TAG_JSON_PATH")
-        try:
-            self.tag_dict = self.load_tags()
-        except json.decoder.JSONDecodeError:
-            self.tag_dict = {}
-        except FileNotFoundError:
-            self.tag_dict = {}
-            if not os.path.exists("json"):
-                os.makedirs("json")
-            os.close(os.open(self.tag_json_path, os.O_CREAT))
         self.degen_channel = os.getenv("DEGEN_CHANNEL_ID")
         self.bot = bot
         super().__init__()
 
-    def load_tags(self) -> Dict[str, Dict]:
-        with open(self.tag_json_path, "r", encoding="utf-8") as disk_lib:
-            return json.loads(disk_lib.read())
-
-    def dump_tags(self) -> None:
-        with open(self.tag_json_path, "w", encoding="utf-8") as disk_lib:
-            disk_lib.write(json.dumps(self.tag_dict, sort_keys=True))
-
-    def encode_tag_data(self, data: str) -> str:
-        return base64.b64encode(data.encode("utf-8")).decode("utf-8")
-
-    def decode_tag_data(self, data: str) -> str:
-        return base64.b64decode(data.encode("utf-8")).decode("utf-8")
+    @property
+    def tag_store(self):
+        return self.bot.tag_store
 
     async def tag_autocomplete(
         self, interaction: discord.Interaction, current: str
     ) -> List[app_commands.Choice[str]]:
-        choices = [*self.tag_dict]
-        tags = [
+        # Discord autocomplete only supports 25 elements
+        return [
             app_commands.Choice(name=choice, value=choice)
-            for choice in choices
-            if current.lower() in choice.lower()
+            for choice in self.tag_store.index.search(current, 25)
         ]
-        if len(tags) > 25:
-            return tags[:25]
-            # Discord autocomplete only supports 25 elements
-            # Without this, users are not shown any elements of the tag list when total tags > 25
-        return tags
 
     @app_commands.command(name="post", description="Post a tag in chat.")
     @app_commands.autocomplete(choice=tag_autocomplete)
     async def post_tag(self, interaction: discord.Interaction, choice: str):
-        data = self.tag_dict[choice]["data"]
-        decoded_data = self.decode_tag_data(data)
-        await interaction.response.send_message(decoded_data)
+        tag = await self.tag_store.get(choice)
+        if tag is None:
+            await interaction.response.send_message(
+                f"Tag `{choice}` does not exist.", ephemeral=True
+            )
+            return
+        self.tag_store.index.record_use(choice)
+        await interaction.response.send_message(tag.data)
 
     @app_commands.command(name="submit", description="Submit a new tag for review.")
     async def submit_tag(
@@ -71,7 +49,7 @@ class TagSystemGroup(app_commands.Group, name="tag"):
     ):
         tag_clean = tag.strip()
         content_clean = content.strip()
-        if tag_clean in self.tag_dict:
+        if tag_clean in self.tag_store:
             await interaction.response.send_message(
                 f"Tag `{tag_clean}` already exists!", ephemeral=True
             )
@@ -94,12 +72,7 @@ class TagSystemGroup(app_commands.Group, name="tag"):
     async def remove_tag(self, interaction: discord.Interaction, tag: str):
         # TODO - Extract deletion to confirmation dialog buttons?
         tag_clean = tag.strip()
-        if tag_clean in self.tag_dict:
-            # Deep clone in place so as not to interfere with other async funcs that may be reading dict at time
-            clone = copy.deepcopy(self.tag_dict)
-            del clone[tag_clean]
-            self.tag_dict = clone
-            self.dump_tags()
+        if await self.tag_store.remove(tag_clean):
             await interaction.response.send_message(
                 "Tag successfully removed.", ephemeral=True
             )
@@ -137,13 +110,14 @@ class TagSystemGroup(app_commands.Group, name="tag"):
             await interaction.message.channel.send(
                 f"Tag `{tag}` approved by {interaction.user}."
             )
-            encoded_data = self.encode_tag_data(data)
-            self.tag_dict[tag] = {
-                "data": encoded_data,
-                "author": interaction.user.name,
-                "creation": interaction.created_at.strftime("%a %d %b %Y, %I:%M%p %Z"),
-            }
-            self.dump_tags()
+            await self.tag_store.add(
+                tag,
+                Tag(
+                    data=data,
+                    author=interaction.user.name,
+                    creation=interaction.created_at.strftime("%a %d %b %Y, %I:%M%p %Z"),
+                ),
+            )
             await interaction.message.delete()
 
         approval_button.callback = approval_callback
@@ -1,17 +1,21 @@
+import asyncio
+import io
 import logging
 import random
-import re
-import os
 
-from aiohttp import ClientSession
-
-from PIL import Image, ImageSequence, ImageDraw, ImageFont
 import discord
 from discord import app_commands
-from discord.ext import commands
+from discord.ext import commands, tasks
 from datetime import datetime, timezone
 
-from utils import log_utils
+from utils import compositing, log_utils
+from utils.masked_links import find_masked_links
+from utils.message_store import MessageStore, StoredMessage
+from utils.reaction_tally import ReactionTally
+from utils.render_cache import RenderCache
+from utils.render_executor import RenderTimeout
+from utils.render_scheduler import RenderBusy
+from utils.triggers import Trigger, TriggerRules
 
 utc = timezone.utc
 
@@ -22,8 +26,16 @@ class Events(commands.Cog):
         self.log_channel_name = "degen-log"
         self.log_channel_name_md = "degen-log-md"
         self.bot = bot
-        self.vel_meme_path = "images/VelMeme.png"
         self.last_deleted = 0
+        self.triggers = TriggerRules.from_env()
+        self.reaction_votes = ReactionTally.from_env()
+        self.message_store = MessageStore.from_env()
+
+    async def cog_load(self):
+        self.reload_triggers.start()
+
+    async def cog_unload(self):
+        self.reload_triggers.cancel()
 
     @commands.Cog.listener(name="on_error")
     async def log_error(self, event: str, *args, **kwargs):
@@ -37,252 +49,143 @@ class Events(commands.Cog):
             f"User {log_utils.format_user(interaction.user)} used command {log_utils.format_app_command_name(command)} in {log_utils.format_channel_name(interaction.channel)}"
         )
 
+    @tasks.loop(seconds=30)
+    async def reload_triggers(self):
+        self.triggers.reload_if_changed()
+
     @commands.Cog.listener(name="on_message")
-    async def nerd_event(self, message: discord.Message):
+    async def route_message(self, message: discord.Message):
+        if message.guild is not None:
+            self.message_store.add(message)
         if message.author == self.bot.user:
             return
 
-        if message.content.lower() == "nerd":
+        actions = [
+            self.run_trigger(trigger, message)
+            for trigger in self.triggers.router.match(
+                message.author.id, message.content
+            )
+        ]
+        if not message.author.bot:
+            actions.append(self.masked_url_event(message))
+        for result in await asyncio.gather(*actions, return_exceptions=True):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    f"Message trigger failed on {message.jump_url}", exc_info=result
+                )
+
+    async def run_trigger(self, trigger: Trigger, message: discord.Message):
+        if trigger.chance < 1 and random.random() >= trigger.chance:
+            return
+        if trigger.action == "echo_delete":
             await message.channel.send(message.content)
             self.last_deleted = message.id
             await message.delete()
-            self.logger.info(f"nerd event triggered on message {message.jump_url}")
+            self.logger.info(
+                f"{trigger.name} event triggered on message {message.jump_url}"
+            )
+        elif trigger.action == "replace":
+            response = trigger.response.replace("{mention}", message.author.mention)
+            sent = await message.channel.send(response)
+            self.last_deleted = message.id
+            await message.delete()
+            self.logger.info(
+                f"{trigger.name} {response} triggered by {message.author.display_name} {sent.jump_url}"
+            )
+        elif trigger.action == "reply":
+            await message.reply(content=trigger.response)
+        elif trigger.action == "vel":
+            await self.vel_event(message)
+        else:
+            self.logger.warning(f"Unknown trigger action {trigger.action!r}")
 
-    @commands.Cog.listener(name="on_message")
     async def vel_event(self, message: discord.Message):
-        vel_id = 234455334033293312  # <-- Vel
-        if message.author.id == vel_id and "gay" in message.content.lower():
-            msg = message.content
+        msg = message.content
+        lowered = msg.lower()
+
+        emote_start = lowered.find("<:gay:")
+        if emote_start != -1:
+            # emote message
+            emote = msg[emote_start : lowered.find(">", emote_start)].split(":")
+            num = emote[2] if emote[0] != "a" else emote[3]
 
-            if "<:gay:" in msg.lower():
-                # emote message
+            async def render_emote():
+                emoji = await self.bot.emoji_cache.get(num)
                 avatar = message.author.display_avatar
-                fn = str(vel_id) + "_temp"
-                fn_o = "vel_output.gif"
-                frame_list = []
-                emote = msg[
-                    msg.lower()
-                    .find("<:gay:") : msg.lower()
-                    .find(">", msg.lower().find("<:gay:"))
-                ].split(":")
-                num = emote[2] if emote[0] != "a" else emote[3]
-                e_url = f"https://cdn.discordapp.com/emojis/{num}.png"
-                fn_e = num + ".png"
-
-                # download emoji
-                async with ClientSession() as session:
-                    async with session.get(e_url) as resp:
-                        emoji = await resp.read()
-
-                with open(fn_e, "wb") as binary:
-                    binary.write(emoji)
-
-                await avatar.save(fn)
-                with Image.open(fn) as im:
-                    idx = 1
-                    duration = 0
-                    for frame in ImageSequence.Iterator(im):
-                        frame_list.append(
-                            self.build_vel_emote_meme(frame, self.vel_meme_path, fn_e)
-                        )
-                        idx += 1
-                        try:
-                            duration += im.info["duration"]
-                        except KeyError:
-                            continue
-                    frame_duration = int(idx / duration) if duration > 0 else 1000
-                frame_list[0].save(
-                    fn_o,
-                    save_all=True,
-                    append_images=frame_list[1:],
-                    optimize=False,
-                    duration=frame_duration,
-                    loop=0,
+                data = await self.bot.avatar_service.read(
+                    avatar, compositing.SPECS["vel"].avatar_size
                 )
-                await message.reply(file=discord.File(fp=fn_o))
-                if os.path.exists(fn):
-                    os.remove(fn)
-                else:
-                    print(f"Error occurred when deleting file:\t{fn}")
-                if os.path.exists(fn_o):
-                    os.remove(fn_o)
-                else:
-                    print(f"Error occurred when deleting file:\t{fn_o}")
-                if os.path.exists(fn_e):
-                    os.remove(fn_e)
-                else:
-                    print(f"Error occurred when deleting file:\t{fn_e}")
+                result = await self.bot.render_executor.run(
+                    compositing.render_meme,
+                    "vel",
+                    avatar.key,
+                    data,
+                    None,
+                    emoji.image.tobytes(),
+                )
+                self.logger.info(f"Rendered vel emote meme: {result.describe()}")
+                return result.data
+
+            key = RenderCache.make_key(
+                compositing.RENDER_TAG,
+                message.author.display_avatar.key,
+                "vel-emote",
+                num,
+            )
+            await self.send_vel_meme(message, key, render_emote)
+        else:
+            # not an emote message
+            idx = lowered.find(" gay")
+            ln = 44
+            if idx == -1:  # no space
+                idx = 0
+                text = msg[: idx + 3] if idx < ln - 3 else msg[idx - (ln - 3) : idx + 3]
             else:
-                # not an emote message
-                idx = msg.lower().find(" gay")
-                ln = 44
-                if idx == -1:  # no space
-                    idx = 0
-                    text = (
-                        msg[: idx + 3]
-                        if idx < ln - 3
-                        else msg[idx - (ln - 3) : idx + 3]
-                    )
-                else:
-                    text = (
-                        msg[: idx + 4]
-                        if idx < ln - 4
-                        else msg[idx - (ln - 4) : idx + 4]
-                    )
-                text = text.strip()
-                if text != msg.lower():
-                    text = "-" + text + "-"
-                size = 16 if len(text) > 20 else 24
-                font = ImageFont.truetype("calibrib.ttf", size)
-                text = self.get_wrapped_text(text, font, 100)
+                text = msg[: idx + 4] if idx < ln - 4 else msg[idx - (ln - 4) : idx + 4]
+            text = text.strip()
+            if text != lowered:
+                text = "-" + text + "-"
 
+            async def render_text():
                 avatar = message.author.display_avatar
-                fn = str(vel_id) + "_temp"
-                fn_o = "vel_output.gif"
-                frame_list = []
-                await avatar.save(fn)
-                with Image.open(fn) as im:
-                    idx = 1
-                    duration = 0
-                    for frame in ImageSequence.Iterator(im):
-                        frame_list.append(
-                            self.build_vel_meme(frame, self.vel_meme_path, text, font)
-                        )
-                        idx += 1
-                        try:
-                            duration += im.info["duration"]
-                        except KeyError:
-                            continue
-                    frame_duration = int(idx / duration) if duration > 0 else 1000
-                frame_list[0].save(
-                    fn_o,
-                    save_all=True,
-                    append_images=frame_list[1:],
-                    optimize=False,
-                    duration=frame_duration,
-                    loop=0,
+                data = await self.bot.avatar_service.read(
+                    avatar, compositing.SPECS["vel"].avatar_size
                 )
-                await message.reply(file=discord.File(fp=fn_o))
-                if os.path.exists(fn):
-                    os.remove(fn)
-                else:
-                    print(f"Error occurred when deleting file:\t{fn}")
-                if os.path.exists(fn_o):
-                    os.remove(fn_o)
-                else:
-                    print(f"Error occurred when deleting file:\t{fn_o}")
-
-    def build_vel_meme(
-        self, icon: Image, path: str, msg: str, font: ImageFont.ImageFont
-    ):
-        meme = Image.open(path)
-        i_dim = 88
-        iresize = icon.resize((i_dim, i_dim), Image.LANCZOS)
-        x1, y1 = 29, 112
-        x2, y2 = x1 + i_dim, y1 + i_dim
-        mask = iresize.convert("RGBA")
-        meme.paste(iresize, (x1, y1, x2, y2), mask)
-        x1, y1 = 429, 113
-        x2, y2 = x1 + i_dim, y1 + i_dim
-        mask = iresize.convert("RGBA")
-        meme.paste(iresize, (x1, y1, x2, y2), mask)
-
-        draw = ImageDraw.Draw(meme)
-        draw.text((30, 40), msg, font=font, fill="#000000")
-        return meme
-
-    def build_vel_emote_meme(self, icon: Image, path: str, emote: str):
-        meme = Image.open(path)
-        i_dim = 88
-        iresize = icon.resize((i_dim, i_dim), Image.LANCZOS)
-        x1, y1 = 29, 112
-        x2, y2 = x1 + i_dim, y1 + i_dim
-        mask = iresize.convert("RGBA")
-        meme.paste(iresize, (x1, y1, x2, y2), mask)
-        x1, y1 = 429, 113
-        x2, y2 = x1 + i_dim, y1 + i_dim
-        mask = iresize.convert("RGBA")
-        meme.paste(iresize, (x1, y1, x2, y2), mask)
-
-        emoji = Image.open(emote)
-        e_dim = 64
-        eresize = emoji.resize((e_dim, e_dim), Image.LANCZOS)
-        x1, y1 = 64, 40
-        x2, y2 = x1 + e_dim, y1 + e_dim
-        mask = eresize.convert("RGBA")
-        meme.paste(eresize, (x1, y1, x2, y2), mask)
-
-        return meme
-
-    def get_wrapped_text(self, text: str, font: ImageFont.ImageFont, line_length: int):
-        # from https://stackoverflow.com/a/67203353
-        lines = [""]
-        for word in text.split():
-            line = f"{lines[-1]} {word}".strip()
-            if font.getlength(line) <= line_length:
-                lines[-1] = line
-            else:
-                lines.append(word)
-        return "\n".join(lines)
-
-    @commands.Cog.listener(name="on_message")
-    async def based_event(self, message: discord.Message):
-        if message.author == self.bot.user:
+                result = await self.bot.render_executor.run(
+                    compositing.render_meme, "vel", avatar.key, data, text
+                )
+                self.logger.info(f"Rendered vel text meme: {result.describe()}")
+                return result.data
+
+            key = RenderCache.make_key(
+                compositing.RENDER_TAG,
+                message.author.display_avatar.key,
+                "vel",
+                text,
+            )
+            await self.send_vel_meme(message, key, render_text)
+
+    async def send_vel_meme(self, message: discord.Message, key: str, render):
+        try:
+            output = await self.bot.render_cache.get_or_render(
+                key,
+                lambda: self.bot.render_scheduler.submit(
+                    key, message.author.id, render
+                ),
+            )
+        except RenderBusy as error:
+            # Message storms just drop the extra memes rather than queueing them
+            self.logger.info(f"Skipped vel meme for {message.jump_url}: {error}")
             return
-
-        if message.content.lower() == "based":
-            if random.randint(1, 5) == 2:
-                await message.reply(content="Based? Based on what?")
-
-    @commands.Cog.listener(name="on_message")
-    async def thinkematic_event(self, message: discord.Message):
-        if message.author == self.bot.user:
+        except RenderTimeout as error:
+            self.logger.warning(f"Vel meme render timed out: {error}")
             return
-
-        thinkematics_tm = {
-            "🤔😉": "<:winking:359819933711859713>",
-            "🤔🇯🇵": "<:weebthink:359798823725432842>",
-            "🤔🖕": "<:upthink:359820561305829386>",
-            "🤔☯": "<:thinkyang:359822049650147339>",
-            "🤔🌊": "<:thinkwave:359800247876059139>",
-            "🤔✝️": "<:thinkusVult:537783872595689487>",
-            "🤔👍": "<:thinkup:359823000159387649>",
-            "🤔😐": "<:thinkstare:359820274532614144>",
-            "🤔🔄": "<a:fidgetthink:1153410621057011762>",
-            "🤔🔃": "<a:fidgetthink_alt:1153411438271013065>",
-            "🤔😡": "<:thinkrage:359798824404910080>",
-            "🤔🍆": "<:thinkplant:359822667655938048>",
-            "🤔💻": "<:thinkpad:359821250484502540>",
-            "🤔😕": "<:thinkfusing:359822865584881690>",
-            "🤔🐟": "<:thinkfish:359822611191955466>",
-            "🤔💦": "<:thinkdrops:359821539392225291>",
-            "🤔🤔": "<:thinkception:359822479147008000>",
-            "🤔⬜": "<:squarethink:359821163817467904>",
-            "🤔🥔": "<:spudthink:1160997520474902569>",
-            "🤔🦀": "<:crabthink:1175152963199701062>",
-            "🤔🎩": "<:mthinking:359821640340733952>",
-            "🤔👈": "<:leftythink:359821079264624640>",
-            "🤔👏": "<:clapking:359798826388815889>",
-            "🤔🍞": "<:breading:359821383401865228>",
-            "🤔🍺": "<:beerthink:359821722439909376>",
-            "🤔😫": "<:thinkyawn:359821867634393089>",
-            "🤔🍿": "<:thinkcorn:376774691144204288>",
-            "🤔🅱️": "<:bhinking:537783061656371220>",
-            "🤔💩": "<:poopthink:538566107687288862>",
-            "🤔👀": "<:thinkeyes:359798823486226443>",
-            "🤔👌": "<:ok_thinking:359798825763995648>",
-            "🤔⬆️⬆️⬇️⬇️⬅️➡️⬅️➡️🇧🇦": f"{message.author.mention} is a nerd! 🤓",
-        }
-
-        pruned = message.content.replace(" ", "")
-        think = thinkematics_tm.get(pruned)
-        if think is not None:
-            think_message = await message.channel.send(think)
-            self.last_deleted = message.id
-            await message.delete()
-            self.logger.info(
-                f"Thinkematics {think} triggered by {message.author.display_name} {think_message.jump_url}"
+        await message.reply(
+            file=discord.File(
+                io.BytesIO(output),
+                filename=f"vel_output.{compositing.OUTPUT_EXTENSION}",
             )
+        )
 
     # @commands.Cog.listener(name="on_message")
     # async def rachael_clown_event(self, message: discord.Message):
@@ -304,23 +207,15 @@ class Events(commands.Cog):
     #             if window_min < msg_time < window_max:
     #                 await message.reply(content="🤡")
 
-    @commands.Cog.listener(name="on_message")
     async def masked_url_event(self, message: discord.Message):
-        if message.author.bot:
+        links = find_masked_links(message.content)
+        if not links:
             return
-
-        log_channel = discord.utils.find(
-            lambda channel: channel.name == self.log_channel_name,
-            message.guild.channels,
-        )
+        log_channel = self.bot.guild_index.channel(message.guild, self.log_channel_name)
         if log_channel is None:
             raise Exception("Log channel not found")
 
-        masked_url_pattern = r"\[(?P<mask>.+)\]\((?P<url>.*)\)"
-        for masked_url in re.finditer(masked_url_pattern, message.content):
-            mask = masked_url.group("mask")
-            url = masked_url.group("url")
-
+        for mask, url in links:
             log_embed = discord.Embed(
                 color=discord.Color.yellow(),
                 title="Masked URL in message",
@@ -334,7 +229,7 @@ class Events(commands.Cog):
             log_embed.add_field(name="Mask", value=f"`{mask}`", inline=True)
             log_embed.add_field(name="URL", value=f"`{url}`", inline=True)
 
-            await log_channel.send(embed=log_embed)
+            self.bot.log_sink.submit(log_channel, log_embed)
             self.logger.info(
                 f"Masked URL [{mask}]({url}) posted in {log_utils.format_channel_name(message.channel)} {message.jump_url}"
             )
@@ -344,48 +239,126 @@ class Events(commands.Cog):
         if after.id == 136586501436735488 and after.timed_out_until:
             await after.timeout(None)
 
-    @commands.Cog.listener(name="on_message_delete")
-    async def message_deleted(self, message: discord.Message):
-        if message.id == self.last_deleted:
+    @commands.Cog.listener(name="on_raw_message_edit")
+    async def message_edited(self, payload: discord.RawMessageUpdateEvent):
+        if "content" in payload.data:
+            self.message_store.edit(payload.message_id, payload.data["content"])
+
+    @commands.Cog.listener(name="on_raw_message_delete")
+    async def message_deleted(self, payload: discord.RawMessageDeleteEvent):
+        record = self.message_store.pop(payload.message_id)
+        if payload.message_id == self.last_deleted or payload.guild_id is None:
             return
-        log_channel = discord.utils.find(
-            lambda channel: channel.name == self.log_channel_name_md,
-            message.channel.guild.channels,
-        )
-        if log_channel is None:
-            raise Exception("Log channel not found")
+        if record is None and payload.cached_message is not None:
+            record = StoredMessage.from_message(payload.cached_message)
+        log_channel, channel = self.deletion_log_channels(payload)
 
-        formatted_message = message.content.replace("```", "``").replace("\n", "\n- ")
+        if record is not None:
+            formatted_message = record.content.replace("```", "``").replace(
+                "\n", "\n- "
+            )
+            description = f"```diff\n- {formatted_message}\n```"
+        else:
+            description = "*Message was not in the message store.*"
         log_embed = discord.Embed(
             color=discord.Color.red(),
             title="Messaage Deleted",
-            description=f"```diff\n- {formatted_message}\n```",
+            description=description,
+            timestamp=datetime.now(tz=utc),
+        )
+        if record is not None:
+            self.set_record_author(log_embed, channel.guild, record.author_id)
+        log_embed.set_footer(text=f"#{channel.name}")
+
+        if record is not None and record.attachments:
+            log_embed.add_field(name="Files", value="\n".join(record.attachments))
+
+        self.bot.log_sink.submit(log_channel, log_embed)
+
+    @commands.Cog.listener(name="on_raw_bulk_message_delete")
+    async def messages_bulk_deleted(self, payload: discord.RawBulkMessageDeleteEvent):
+        records = self.message_store.pop_many(payload.message_ids)
+        if payload.guild_id is None:
+            return
+        log_channel, channel = self.deletion_log_channels(payload)
+
+        lines = []
+        for record in records:
+            member = channel.guild.get_member(record.author_id)
+            author = member.display_name if member else str(record.author_id)
+            content = record.content.replace("```", "``").replace("\n", " ")
+            if record.attachments:
+                content += f" [{len(record.attachments)} file(s)]"
+            lines.append(f"- {author}: {content}")
+        missing = len(payload.message_ids) - len(records)
+        if missing:
+            lines.append(f"- ({missing} message(s) not in the message store)")
+
+        body = "\n".join(lines)
+        limit = 4096 - len("```diff\n\n```") - len("\n…")
+        if len(body) > limit:
+            body = body[:limit] + "\n…"
+        log_embed = discord.Embed(
+            color=discord.Color.red(),
+            title=f"{len(payload.message_ids)} Messages Bulk Deleted",
+            description=f"```diff\n{body}\n```",
             timestamp=datetime.now(tz=utc),
         )
-        log_embed.set_author(
-            name=message.author.display_name,
-            icon_url=message.author.display_avatar.url,
+        log_embed.set_footer(text=f"#{channel.name}")
+        self.bot.log_sink.submit(log_channel, log_embed)
+
+    def deletion_log_channels(self, payload):
+        channel = self.bot.get_channel(payload.channel_id)
+        log_channel = self.bot.guild_index.channel(
+            channel.guild, self.log_channel_name_md
         )
-        log_embed.set_footer(text=f"#{message.channel.name}")
+        if log_channel is None:
+            raise Exception("Log channel not found")
+        return log_channel, channel
 
-        if len(message.attachments) > 0:
-            log_embed.add_field(
-                name="Files",
-                value="\n".join(
-                    [att.url or att.proxy_url for att in message.attachments]
-                ),
+    def set_record_author(
+        self, embed: discord.Embed, guild: discord.Guild, author_id: int
+    ):
+        author = guild.get_member(author_id) or self.bot.get_user(author_id)
+        if author is not None:
+            embed.set_author(
+                name=author.display_name, icon_url=author.display_avatar.url
             )
-
-        await log_channel.send(embed=log_embed)
+        else:
+            embed.set_author(name=str(author_id))
 
     @commands.Cog.listener(name="on_raw_reaction_add")
     async def x_reaction(self, payload: discord.RawReactionActionEvent):
-        if payload.emoji.name == "❌":
-            channel = self.bot.get_channel(payload.channel_id)
-            message = await channel.fetch_message(payload.message_id)
-            reaction = discord.utils.get(message.reactions, emoji=payload.emoji.name)
-            if reaction.count >= 4:
-                self.logger.info(
-                    f"Message {payload.message_id} reached 4 X reactions, deleting."
-                )
-                await message.delete()
+        emoji = str(payload.emoji)
+        if not self.reaction_votes.add(payload.channel_id, payload.message_id, emoji):
+            return
+        threshold = self.reaction_votes.rule(payload.channel_id).threshold
+        channel = self.bot.get_channel(payload.channel_id)
+        message = await channel.fetch_message(payload.message_id)
+        reaction = discord.utils.find(
+            lambda r: str(r.emoji) == emoji, message.reactions
+        )
+        count = reaction.count if reaction is not None else 0
+        if count >= threshold:
+            self.logger.info(
+                f"Message {payload.message_id} reached {threshold} {emoji} reactions, deleting."
+            )
+            self.reaction_votes.forget(payload.message_id)
+            await message.delete()
+        else:
+            self.reaction_votes.sync(payload.message_id, count)
+
+    @commands.Cog.listener(name="on_raw_reaction_remove")
+    async def x_reaction_removed(self, payload: discord.RawReactionActionEvent):
+        self.reaction_votes.remove(
+            payload.channel_id, payload.message_id, str(payload.emoji)
+        )
+
+    @commands.Cog.listener(name="on_raw_reaction_clear")
+    async def reactions_cleared(self, payload: discord.RawReactionClearEvent):
+        self.reaction_votes.forget(payload.message_id)
+
+    @commands.Cog.listener(name="on_raw_reaction_clear_emoji")
+    async def reaction_emoji_cleared(self, payload: discord.RawReactionClearEmojiEvent):
+        if str(payload.emoji) == self.reaction_votes.rule(payload.channel_id).emoji:
+            self.reaction_votes.forget(payload.message_id)
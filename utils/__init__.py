@@ -1 +1,8 @@
-from .json_db import load_json_db, dump_json_db
+from .json_db import (
+    load_json_db,
+    dump_json_db,
+    JsonStore,
+    JournalStore,
+    open_store,
+    close_all_stores,
+)
@@ -0,0 +1,141 @@
+import heapq
+from collections import Counter
+from typing import Container, Dict, Iterable, List, Optional, Set
+
+# Grams of every length up to this are indexed, so queries this short are an
+# exact lookup and longer ones intersect their trigrams
+GRAM = 3
+
+
+def normalize(key: str) -> str:
+    return key.casefold()
+
+
+def grams(text: str) -> Set[str]:
+    return {
+        text[i : i + size]
+        for size in range(1, GRAM + 1)
+        for i in range(len(text) - size + 1)
+    }
+
+
+class TrieNode:
+    __slots__ = ("children", "keys")
+
+    def __init__(self):
+        self.children: Dict[str, "TrieNode"] = {}
+        self.keys: Set[str] = set()
+
+
+class AutocompleteIndex:
+    """
+    Case-insensitive choice index for Discord autocomplete. Keys are
+    normalized once on insert; a trie answers prefix matches and an n-gram
+    index answers substring matches. Prefix hits rank first, then by how
+    often a key has been used, then alphabetically, and the substring pass is
+    skipped whenever prefix hits already fill the result.
+    """
+
+    def __init__(self, keys: Iterable[str] = ()):
+        self.normalized: Dict[str, str] = {}
+        self.root = TrieNode()
+        self.gram_index: Dict[str, Set[str]] = {}
+        self.uses: Counter = Counter()
+        for key in keys:
+            self.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.normalized
+
+    def __len__(self) -> int:
+        return len(self.normalized)
+
+    def add(self, key: str) -> None:
+        if key in self.normalized:
+            return
+        norm = self.normalized[key] = normalize(key)
+        node = self.root
+        for char in norm:
+            node = node.children.setdefault(char, TrieNode())
+        node.keys.add(key)
+        for gram in grams(norm):
+            self.gram_index.setdefault(gram, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        norm = self.normalized.pop(key, None)
+        if norm is None:
+            return
+        path = [self.root]
+        for char in norm:
+            path.append(path[-1].children[char])
+        path[-1].keys.discard(key)
+        # Prune nodes left with nothing below them
+        for depth in range(len(norm), 0, -1):
+            node = path[depth]
+            if node.keys or node.children:
+                break
+            del path[depth - 1].children[norm[depth - 1]]
+        for gram in grams(norm):
+            holders = self.gram_index[gram]
+            holders.discard(key)
+            if not holders:
+                del self.gram_index[gram]
+
+    def rename(self, key: str, new_key: str) -> None:
+        uses = self.uses.pop(key, 0)
+        self.remove(key)
+        self.add(new_key)
+        if uses:
+            self.uses[new_key] += uses
+
+    def record_use(self, key: str) -> None:
+        if key in self.normalized:
+            self.uses[key] += 1
+
+    def search(
+        self, query: str, limit: int = 25, allowed: Optional[Container[str]] = None
+    ) -> List[str]:
+        """Up to `limit` keys containing `query`, best first."""
+        query = normalize(query)
+
+        def rank(key: str):
+            return (-self.uses[key], key)
+
+        prefix = [k for k in self._prefixed(query) if allowed is None or k in allowed]
+        results = heapq.nsmallest(limit, prefix, key=rank)
+        if len(results) >= limit:
+            return results
+        seen = set(prefix)
+        substring = [
+            key
+            for key in self._containing(query)
+            if key not in seen and (allowed is None or key in allowed)
+        ]
+        return results + heapq.nsmallest(limit - len(results), substring, key=rank)
+
+    def _prefixed(self, query: str) -> Iterable[str]:
+        node = self.root
+        for char in query:
+            node = node.children.get(char)
+            if node is None:
+                return
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield from node.keys
+            stack.extend(node.children.values())
+
+    def _containing(self, query: str) -> Iterable[str]:
+        if not query:
+            return self.normalized
+        if len(query) <= GRAM:
+            return self.gram_index.get(query, ())
+        holders = sorted(
+            (
+                self.gram_index.get(query[i : i + GRAM], set())
+                for i in range(len(query) - GRAM + 1)
+            ),
+            key=len,
+        )
+        candidates = set.intersection(*holders)
+        return [key for key in candidates if query in self.normalized[key]]
@@ -0,0 +1,73 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+import discord
+
+
+def negotiate_size(target: int) -> int:
+    # Discord serves avatars at powers of two between 16 and 4096
+    size = 16
+    while size < target and size < 4096:
+        size *= 2
+    return size
+
+
+class AvatarService:
+    """
+    Shared avatar downloader. Requests the smallest CDN size that still covers
+    what the caller will draw, caches the raw bytes by asset key (which changes
+    whenever the avatar does) and coalesces concurrent fetches of the same
+    avatar into a single request.
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.logger = logging.getLogger("bot")
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[Tuple[str, int], bytes]" = OrderedDict()
+        self.size = 0
+        self.pending: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    async def read(self, asset: discord.Asset, target: int) -> bytes:
+        size = negotiate_size(target)
+        key = (asset.key, size)
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+        task = self.pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(asset.with_size(size).read())
+            self.pending[key] = task
+            task.add_done_callback(lambda _: self.pending.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shield so one cancelled waiter doesn't abort the download for the others
+        data = await asyncio.shield(task)
+        self._put(key, data)
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+        }
+
+    def _put(self, key: Tuple[str, int], data: bytes) -> None:
+        if key in self.entries or len(data) > self.max_bytes:
+            return
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
@@ -105,9 +105,7 @@ class BackupCog(commands.Cog, name="Backups"):
         )
 
     async def backup_quotes(self, guild):
-        quotes_channel = discord.utils.find(
-            lambda channel: channel.id == self.quotes_channel, guild.channels
-        )
+        quotes_channel = guild.get_channel(self.quotes_channel)
         yesterday = date.today() - timedelta(days=1)
         quotes = [
             message
@@ -0,0 +1,391 @@
+import io
+import logging
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from PIL import Image, ImageSequence
+
+from utils import fonts
+from utils.emoji_cache import EMOJI_DIM
+from utils.gif_writer import StreamingGifWriter
+from utils.templates import TemplateRegistry, render_text_layer
+
+# Render jobs run inside executor workers, so everything here is a module-level
+# function that takes and returns plain bytes/str and can be pickled.
+
+
+@dataclass(frozen=True)
+class Slot:
+    position: Tuple[int, int]
+    size: int  # slots are square
+
+    @property
+    def box(self) -> Tuple[int, int, int, int]:
+        x, y = self.position
+        return x, y, x + self.size, y + self.size
+
+
+@dataclass(frozen=True)
+class TextSlot:
+    position: Tuple[int, int]
+    width: int
+    font: str
+    size: int
+    small_size: int  # used once the text is longer than small_after characters
+    small_after: int
+    fill: str = "#000000"
+
+    def font_size(self, text: str) -> int:
+        return self.small_size if len(text) > self.small_after else self.size
+
+
+@dataclass(frozen=True)
+class TemplateSpec:
+    """
+    Declarative description of an avatar meme: a base image, the squares the
+    avatar is pasted into, and optional text/emoji slots drawn on top. Adding a
+    meme command only needs a new entry in SPECS.
+    """
+
+    path: str
+    avatar_slots: Tuple[Slot, ...]
+    text_slot: Optional[TextSlot] = None
+    emoji_slot: Optional[Slot] = None
+
+    @property
+    def avatar_size(self) -> int:
+        # Largest slot, so callers can negotiate how big an avatar to download
+        return max(slot.size for slot in self.avatar_slots)
+
+
+SPECS: Dict[str, TemplateSpec] = {
+    "mobile": TemplateSpec(
+        path="images/MobileDiscord.png",
+        avatar_slots=(Slot((221, 148), 43),),
+    ),
+    "embed": TemplateSpec(
+        path="images/EmbedDiscord.png",
+        avatar_slots=(Slot((221, 148), 43),),
+    ),
+    "vel": TemplateSpec(
+        path="images/VelMeme.png",
+        avatar_slots=(Slot((29, 112), 88), Slot((429, 113), 88)),
+        text_slot=TextSlot(
+            (30, 40), 100, "calibrib.ttf", size=24, small_size=16, small_after=20
+        ),
+        emoji_slot=Slot((64, 40), EMOJI_DIM),
+    ),
+}
+RENDER_VERSION = 6
+FRAME_CACHE_MAX_BYTES = 64 * 1024 * 1024
+MAX_FRAMES = int(os.getenv("RENDER_MAX_FRAMES", "100"))
+DEFAULT_FRAME_DURATION = 100  # ms, for frames that don't specify one
+
+# Output knobs. RENDER_QUALITY (1-100) trades size for fidelity: it sets the
+# GIF palette size and dithering, and the WebP quality.
+OUTPUT_EXTENSIONS = {"gif": "gif", "webp": "webp", "apng": "png"}
+OUTPUT_FORMAT = (os.getenv("RENDER_FORMAT") or "gif").lower()
+if OUTPUT_FORMAT not in OUTPUT_EXTENSIONS:
+    logging.getLogger("bot").warning(
+        f"Unsupported RENDER_FORMAT {OUTPUT_FORMAT!r} (expected gif, webp or apng), using gif"
+    )
+    OUTPUT_FORMAT = "gif"
+OUTPUT_EXTENSION = OUTPUT_EXTENSIONS[OUTPUT_FORMAT]
+QUALITY = max(1, min(100, int(os.getenv("RENDER_QUALITY", "80"))))
+PALETTE_COLORS = max(16, min(256, round(256 * QUALITY / 100)))
+DITHER = Image.Dither.FLOYDSTEINBERG if QUALITY >= 50 else Image.Dither.NONE
+PALETTE_SAMPLES = 16
+# Part of every render cache key; changes whenever output for the same inputs would
+RENDER_TAG = f"{RENDER_VERSION}:{OUTPUT_FORMAT}:{QUALITY}"
+
+_templates: Optional[TemplateRegistry] = None
+_frame_cache: "OrderedDict[Tuple[str, int], List[AvatarFrame]]" = OrderedDict()
+_frame_cache_size = 0
+# Thread-pool fallback shares this module between workers
+_frame_cache_lock = threading.Lock()
+
+
+def init_worker() -> None:
+    # Called once per worker process so templates are decoded at pool start-up
+    global _templates
+    _templates = TemplateRegistry({name: spec.path for name, spec in SPECS.items()})
+
+
+def get_templates() -> TemplateRegistry:
+    if _templates is None:
+        init_worker()
+    return _templates
+
+
+def ping() -> bool:
+    return True
+
+
+class AvatarFrame(NamedTuple):
+    image: Image.Image  # RGBA, resized to the slot size
+    duration: int  # milliseconds
+
+
+def get_avatar_frames(avatar_key: str, avatar: bytes, dim: int) -> List[AvatarFrame]:
+    """
+    Decodes an avatar into RGBA frames pre-resized to dim x dim, keeping each
+    frame's own duration. Pillow applies the source's disposal while seeking,
+    so every decoded frame is already a full picture. Avatars with more than MAX_FRAMES frames
+    are subsampled, folding the durations of skipped frames into the kept ones
+    so playback speed is unchanged. Cached per worker by (asset key, dim) so
+    repeat renders skip decoding and resampling entirely.
+    """
+    global _frame_cache_size
+    key = (avatar_key, dim)
+    with _frame_cache_lock:
+        frames = _frame_cache.get(key)
+        if frames is not None:
+            _frame_cache.move_to_end(key)
+            return frames
+
+    frames = []
+    with Image.open(io.BytesIO(avatar)) as im:
+        n_frames = getattr(im, "n_frames", 1)
+        step = -(-n_frames // MAX_FRAMES)  # ceil division
+        for idx, frame in enumerate(ImageSequence.Iterator(im)):
+            duration = frame.info.get("duration") or DEFAULT_FRAME_DURATION
+            if idx % step:
+                # Skipped frame: its time goes to the previous kept frame
+                frames[-1] = frames[-1]._replace(
+                    duration=frames[-1].duration + duration
+                )
+                continue
+            frames.append(
+                AvatarFrame(
+                    frame.convert("RGBA").resize((dim, dim), Image.LANCZOS),
+                    duration,
+                )
+            )
+
+    cost = dim * dim * 4 * len(frames)
+    with _frame_cache_lock:
+        if key not in _frame_cache and cost <= FRAME_CACHE_MAX_BYTES:
+            _frame_cache[key] = frames
+            _frame_cache_size += cost
+            while _frame_cache_size > FRAME_CACHE_MAX_BYTES:
+                (_, evicted_dim), evicted = _frame_cache.popitem(last=False)
+                _frame_cache_size -= evicted_dim * evicted_dim * 4 * len(evicted)
+    return frames
+
+
+def build_overlay(
+    spec: TemplateSpec,
+    size: Tuple[int, int],
+    text: Optional[str],
+    emoji: Optional[bytes],
+) -> Optional[Image.Image]:
+    # Everything that doesn't change between frames goes into one layer, drawn once
+    if text is None and emoji is None:
+        return None
+    overlay = Image.new("RGBA", size, (0, 0, 0, 0))
+    if text is not None and spec.text_slot is not None:
+        slot = spec.text_slot
+        font_size = slot.font_size(text)
+        font = fonts.get_font(slot.font, font_size)
+        wrapped = fonts.wrap_text(text, slot.font, font_size, slot.width)
+        overlay.alpha_composite(
+            render_text_layer(size, slot.position, wrapped, font, slot.fill)
+        )
+    if emoji is not None and spec.emoji_slot is not None:
+        slot = spec.emoji_slot
+        layer = Image.frombytes("RGBA", (slot.size, slot.size), emoji)
+        overlay.paste(layer, slot.box, layer)
+    return overlay
+
+
+class RenderResult(NamedTuple):
+    data: bytes
+    frames_in: int
+    frames_out: int
+    # Estimated size of the same render as one adaptive palette per full frame
+    baseline_bytes: int
+
+    @property
+    def bytes_saved(self) -> int:
+        return max(0, self.baseline_bytes - len(self.data))
+
+    def describe(self) -> str:
+        return (
+            f"{self.frames_in}->{self.frames_out} frames, {len(self.data)} bytes "
+            f"{OUTPUT_FORMAT}, ~{self.bytes_saved} bytes saved"
+        )
+
+
+def changed_region(spec: TemplateSpec) -> Tuple[int, int, int, int]:
+    # Only the avatar slots differ from the static template between frames
+    boxes = [slot.box for slot in spec.avatar_slots]
+    return (
+        min(box[0] for box in boxes),
+        min(box[1] for box in boxes),
+        max(box[2] for box in boxes),
+        max(box[3] for box in boxes),
+    )
+
+
+def compose(
+    spec: TemplateSpec,
+    base: Image.Image,
+    overlay: Optional[Image.Image],
+    sized: Dict[int, List[AvatarFrame]],
+    idx: int,
+    region: Tuple[int, int, int, int],
+) -> Image.Image:
+    # Builds only `region` of frame idx, so cropped frames never touch the full template
+    x0, y0 = region[:2]
+    meme = base.crop(region)
+    for slot in spec.avatar_slots:
+        icon = sized[slot.size][idx].image
+        x1, y1, x2, y2 = slot.box
+        meme.paste(icon, (x1 - x0, y1 - y0, x2 - x0, y2 - y0), icon)
+    if overlay is not None:
+        meme.alpha_composite(overlay.crop(region))
+    return meme.convert("RGB")
+
+
+def build_palette(
+    spec: TemplateSpec,
+    base: Image.Image,
+    overlay: Optional[Image.Image],
+    sized: Dict[int, List[AvatarFrame]],
+    region: Tuple[int, int, int, int],
+) -> Image.Image:
+    """
+    One palette for the whole animation, taken from the static template plus a
+    sample of the regions that change, instead of quantizing every frame alone.
+    """
+    n_frames = len(sized[spec.avatar_size])
+    samples = list(range(0, n_frames, max(1, n_frames // PALETTE_SAMPLES)))
+    static = base.copy()
+    if overlay is not None:
+        static.alpha_composite(overlay)
+    height = region[3] - region[1]
+    montage = Image.new("RGB", (static.width, static.height + height * len(samples)))
+    montage.paste(static.convert("RGB"), (0, 0))
+    for row, idx in enumerate(samples):
+        crop = compose(spec, base, overlay, sized, idx, region)
+        montage.paste(crop, (0, static.height + row * height))
+    return montage.quantize(colors=PALETTE_COLORS, method=Image.Quantize.MEDIANCUT)
+
+
+def render_meme(
+    template: str,
+    avatar_key: str,
+    avatar: bytes,
+    text: Optional[str] = None,
+    emoji: Optional[bytes] = None,
+) -> RenderResult:
+    """
+    Renders SPECS[template] over every avatar frame. `emoji` is raw RGBA pixels
+    already sized to the spec's emoji slot (see utils.emoji_cache).
+    """
+    spec = SPECS[template]
+    base = get_templates().templates[template]
+    overlay = build_overlay(spec, base.size, text, emoji)
+
+    # Resize once per distinct slot size; the RGBA frame doubles as its own mask
+    sized = {
+        slot.size: get_avatar_frames(avatar_key, avatar, slot.size)
+        for slot in spec.avatar_slots
+    }
+    frames = sized[spec.avatar_size]
+    full = (0, 0) + base.size
+    region = changed_region(spec)
+
+    first = compose(spec, base, overlay, sized, 0, full)
+    single = io.BytesIO()
+    first.save(single, format="GIF")
+    baseline = len(single.getvalue()) * len(frames)
+
+    if OUTPUT_FORMAT == "gif":
+        data, frames_out = encode_optimized_gif(
+            spec, base, overlay, sized, first, region
+        )
+    else:
+        data, frames_out = encode_animated(spec, base, overlay, sized, first, region)
+    return RenderResult(data, len(frames), frames_out, baseline)
+
+
+def encode_optimized_gif(
+    spec: TemplateSpec,
+    base: Image.Image,
+    overlay: Optional[Image.Image],
+    sized: Dict[int, List[AvatarFrame]],
+    first: Image.Image,
+    region: Tuple[int, int, int, int],
+) -> Tuple[bytes, int]:
+    """
+    Streams a GIF where every frame shares one global palette, frames after the
+    first only cover the avatar region, and identical consecutive frames are
+    merged by adding their durations. Frames are drawn in full on decode, so
+    the output uses disposal 1 (leave in place) for the cropped updates.
+    """
+    frames = sized[spec.avatar_size]
+    palette = build_palette(spec, base, overlay, sized, region)
+
+    def quantize(image: Image.Image) -> Image.Image:
+        return image.quantize(palette=palette, dither=DITHER)
+
+    buffer = io.BytesIO()
+    writer = StreamingGifWriter(buffer, base.size, palette=bytes(palette.getpalette()))
+    # Each frame is held back until we know whether the next one is identical
+    pending = [quantize(first), frames[0].duration, (0, 0)]
+    last = quantize(first.crop(region)).tobytes()
+    for idx in range(1, len(frames)):
+        crop = quantize(compose(spec, base, overlay, sized, idx, region))
+        raw = crop.tobytes()
+        if raw == last:
+            pending[1] += frames[idx].duration
+            continue
+        writer.add_frame(pending[0], pending[1], 1, pending[2])
+        pending = [crop, frames[idx].duration, region[:2]]
+        last = raw
+    writer.add_frame(pending[0], pending[1], 1, pending[2])
+    writer.close()
+    return buffer.getvalue(), writer.frames
+
+
+def encode_animated(
+    spec: TemplateSpec,
+    base: Image.Image,
+    overlay: Optional[Image.Image],
+    sized: Dict[int, List[AvatarFrame]],
+    first: Image.Image,
+    region: Tuple[int, int, int, int],
+) -> Tuple[bytes, int]:
+    # WebP/APNG encoders need every frame up front; MAX_FRAMES bounds how many
+    frames = sized[spec.avatar_size]
+    frame_list = [first]
+    durations = [frames[0].duration]
+    last = first.crop(region).tobytes()
+    for idx in range(1, len(frames)):
+        crop = compose(spec, base, overlay, sized, idx, region)
+        raw = crop.tobytes()
+        if raw == last:
+            durations[-1] += frames[idx].duration
+            continue
+        meme = frame_list[-1].copy()
+        meme.paste(crop, region[:2])
+        frame_list.append(meme)
+        durations.append(frames[idx].duration)
+        last = raw
+
+    buffer = io.BytesIO()
+    options = {"quality": QUALITY, "method": 4} if OUTPUT_FORMAT == "webp" else {}
+    frame_list[0].save(
+        buffer,
+        format="WEBP" if OUTPUT_FORMAT == "webp" else "PNG",
+        save_all=True,
+        append_images=frame_list[1:],
+        duration=durations,
+        loop=0,
+        **options,
+    )
+    return buffer.getvalue(), len(frame_list)
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import logging
+from collections import OrderedDict
+from typing import Dict, NamedTuple
+
+import aiohttp
+from PIL import Image
+
+EMOJI_URL = "https://cdn.discordapp.com/emojis/{}.png"
+EMOJI_DIM = 64
+
+
+class EmojiEntry(NamedTuple):
+    data: bytes  # PNG as served by the CDN
+    image: Image.Image  # decoded RGBA, resized to EMOJI_DIM
+
+
+def decode_emoji(data: bytes) -> Image.Image:
+    with Image.open(io.BytesIO(data)) as im:
+        return im.convert("RGBA").resize((EMOJI_DIM, EMOJI_DIM), Image.LANCZOS)
+
+
+class EmojiCache:
+    """
+    Bounded in-memory cache of custom emoji keyed by emoji ID. Holds both the
+    downloaded bytes and the decoded, pre-resized image so a repeated emote
+    needs neither a request nor a decode.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, max_entries: int = 256):
+        self.logger = logging.getLogger("bot")
+        self.session = session
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, EmojiEntry]" = OrderedDict()
+        self.pending: Dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, emoji_id: str) -> EmojiEntry:
+        entry = self.entries.get(emoji_id)
+        if entry is not None:
+            self.entries.move_to_end(emoji_id)
+            self.hits += 1
+            return entry
+
+        task = self.pending.get(emoji_id)
+        if task is None:
+            self.misses += 1
+            task = asyncio.create_task(self.fetch(emoji_id))
+            self.pending[emoji_id] = task
+            task.add_done_callback(lambda _: self.pending.pop(emoji_id, None))
+        return await asyncio.shield(task)
+
+    async def fetch(self, emoji_id: str) -> EmojiEntry:
+        async with self.session.get(EMOJI_URL.format(emoji_id)) as resp:
+            resp.raise_for_status()
+            data = await resp.read()
+        entry = EmojiEntry(data, await asyncio.to_thread(decode_emoji, data))
+        self.entries[emoji_id] = entry
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
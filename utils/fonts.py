@@ -0,0 +1,39 @@
+from functools import lru_cache
+
+from PIL import ImageFont
+
+# Both caches are per process, so each render worker parses a given TTF once.
+
+
+@lru_cache(maxsize=32)
+def get_font(face: str, size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype(face, size)
+
+
+@lru_cache(maxsize=4096)
+def word_length(face: str, size: int, word: str) -> float:
+    return get_font(face, size).getlength(word)
+
+
+@lru_cache(maxsize=1024)
+def wrap_text(text: str, face: str, size: int, width: int) -> str:
+    """
+    Greedy word wrap to `width` pixels. Each word is measured once and line
+    widths are accumulated, rather than re-measuring every growing prefix.
+    """
+    space = word_length(face, size, " ")
+    lines = []
+    line = []
+    line_width = 0.0
+    for word in text.split():
+        w = word_length(face, size, word)
+        if line and line_width + space + w > width:
+            lines.append(" ".join(line))
+            line = [word]
+            line_width = w
+        else:
+            line_width += (space if line else 0) + w
+            line.append(word)
+    if line:
+        lines.append(" ".join(line))
+    return "\n".join(lines)
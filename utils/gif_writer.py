@@ -0,0 +1,136 @@
+import io
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+from PIL import Image
+
+
+class StreamingGifWriter:
+    """
+    Writes an animated GIF one frame at a time, so only the frame being encoded
+    is ever held in memory. Pillow's save_all keeps every frame until the end,
+    so instead each frame is LZW-encoded by Pillow on its own and its image
+    block is spliced into our stream with its own Graphic Control Extension
+    (duration + disposal) and, unless it shares the global palette, a local
+    colour table.
+    """
+
+    def __init__(
+        self,
+        fp: BinaryIO,
+        size: Tuple[int, int],
+        loop: int = 0,
+        palette: Optional[bytes] = None,
+    ):
+        self.fp = fp
+        self.size = size
+        self.frames = 0
+        self.global_table = None
+        width, height = size
+        fp.write(b"GIF89a")
+        if palette is None:
+            # Logical screen descriptor without a global colour table
+            fp.write(struct.pack("<HHBBB", width, height, 0, 0, 0))
+        else:
+            table_bits, self.global_table = _colour_table(palette)
+            fp.write(struct.pack("<HHBBB", width, height, 0x80 | table_bits, 0, 0))
+            fp.write(self.global_table)
+        # NETSCAPE2.0 looping extension
+        fp.write(b"\x21\xff\x0bNETSCAPE2.0\x03\x01")
+        fp.write(struct.pack("<H", loop))
+        fp.write(b"\x00")
+
+    def add_frame(
+        self,
+        image: Image.Image,
+        duration: int,
+        disposal: int = 0,
+        offset: Tuple[int, int] = (0, 0),
+    ) -> int:
+        """
+        Appends a frame and returns the number of bytes written. P-mode frames
+        quantized against the writer's palette reuse the global colour table
+        instead of carrying their own.
+        """
+        if image.mode != "P":
+            image = image.convert("RGB").convert("P", palette=Image.Palette.ADAPTIVE)
+        encoded = io.BytesIO()
+        # optimize=False stops Pillow from reordering the palette we quantized to
+        image.save(encoded, format="GIF", interlace=False, optimize=False)
+        palette, descriptor, data = _split_single_frame(encoded.getvalue())
+        start = self.fp.tell()
+
+        # Graphic Control Extension: disposal in bits 2-4, delay in centiseconds
+        delay = max(0, round(duration / 10))
+        self.fp.write(
+            struct.pack("<BBBBHBB", 0x21, 0xF9, 4, (disposal & 7) << 2, delay, 0, 0)
+        )
+        _, _, width, height, flags = struct.unpack("<HHHHB", descriptor)
+        table_bits, table = _colour_table(palette)
+        local = table != self.global_table
+        self.fp.write(b"\x2c")
+        self.fp.write(
+            struct.pack(
+                "<HHHHB",
+                offset[0],
+                offset[1],
+                width,
+                height,
+                (0x80 | table_bits if local else 0) | (flags & 0x40),  # keep interlace
+            )
+        )
+        if local:
+            self.fp.write(table)
+        self.fp.write(data)
+        self.frames += 1
+        return self.fp.tell() - start
+
+    def close(self) -> None:
+        self.fp.write(b"\x3b")
+
+
+def _colour_table(palette: bytes) -> Tuple[int, bytes]:
+    # GIF colour tables hold 2 ** (bits + 1) entries; pad up to that
+    table_bits = max(1, (len(palette) // 3 - 1).bit_length()) - 1
+    return table_bits, palette.ljust(3 * (2 ** (table_bits + 1)), b"\x00")
+
+
+def _skip_sub_blocks(buf: bytes, pos: int) -> int:
+    while True:
+        length = buf[pos]
+        pos += 1
+        if length == 0:
+            return pos
+        pos += length
+
+
+def _split_single_frame(buf: bytes) -> Tuple[bytes, bytes, bytes]:
+    """
+    Pulls (colour table, image descriptor fields, LZW data) out of a
+    single-frame GIF as written by Pillow.
+    """
+    packed = buf[10]
+    pos = 13
+    palette = b""
+    if packed & 0x80:
+        table_len = 3 * (2 ** ((packed & 7) + 1))
+        palette = buf[pos : pos + table_len]
+        pos += table_len
+    while pos < len(buf):
+        block = buf[pos]
+        if block == 0x21:  # extension: label, then sub-blocks
+            pos = _skip_sub_blocks(buf, pos + 2)
+        elif block == 0x2C:
+            descriptor = buf[pos + 1 : pos + 10]
+            local = descriptor[8]
+            pos += 10
+            if local & 0x80:
+                table_len = 3 * (2 ** ((local & 7) + 1))
+                palette = buf[pos : pos + table_len]
+                pos += table_len
+            # LZW minimum code size byte followed by the data sub-blocks
+            end = _skip_sub_blocks(buf, pos + 1)
+            return palette, descriptor, buf[pos:end]
+        else:
+            break
+    raise ValueError("No image block found in encoded GIF frame")
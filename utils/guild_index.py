@@ -0,0 +1,142 @@
+import logging
+from typing import Dict, Optional, Union
+
+import discord
+from discord.abc import GuildChannel
+from discord.ext import commands
+
+
+class GuildEntities:
+    """
+    Name lookups for one guild's channels, roles and categories. Names are not
+    unique in Discord, so each name maps to every entity holding it and lookups
+    return the first.
+    """
+
+    def __init__(self, guild: discord.Guild):
+        self.channels: Dict[str, Dict[int, GuildChannel]] = {}
+        self.roles: Dict[str, Dict[int, discord.Role]] = {}
+        self.categories: Dict[int, discord.CategoryChannel] = {}
+        for channel in guild.channels:
+            self.add_channel(channel)
+        for role in guild.roles:
+            self.add_role(role)
+
+    def add_channel(self, channel: GuildChannel) -> None:
+        self.channels.setdefault(channel.name, {})[channel.id] = channel
+        if isinstance(channel, discord.CategoryChannel):
+            self.categories[channel.id] = channel
+
+    def remove_channel(self, channel: GuildChannel) -> None:
+        _discard(self.channels, channel.name, channel.id)
+        self.categories.pop(channel.id, None)
+
+    def add_role(self, role: discord.Role) -> None:
+        self.roles.setdefault(role.name, {})[role.id] = role
+
+    def remove_role(self, role: discord.Role) -> None:
+        _discard(self.roles, role.name, role.id)
+
+    def channel(self, name: str) -> Optional[GuildChannel]:
+        return _first(self.channels.get(name))
+
+    def role(self, name: str) -> Optional[discord.Role]:
+        return _first(self.roles.get(name))
+
+    def category(self, key: Union[int, str]) -> Optional[discord.CategoryChannel]:
+        if isinstance(key, int):
+            return self.categories.get(key)
+        channel = self.channel(key)
+        return channel if isinstance(channel, discord.CategoryChannel) else None
+
+
+def _first(entities: Optional[dict]):
+    return next(iter(entities.values())) if entities else None
+
+
+def _discard(index: dict, name: str, entity_id: int) -> None:
+    entities = index.get(name)
+    if entities is not None:
+        entities.pop(entity_id, None)
+        if not entities:
+            del index[name]
+
+
+class GuildIndex:
+    """Per-guild GuildEntities, built on first use and kept current by GuildIndexCog."""
+
+    def __init__(self):
+        self.guilds: Dict[int, GuildEntities] = {}
+
+    def get(self, guild: discord.Guild) -> GuildEntities:
+        entities = self.guilds.get(guild.id)
+        if entities is None:
+            entities = self.rebuild(guild)
+        return entities
+
+    def rebuild(self, guild: discord.Guild) -> GuildEntities:
+        entities = self.guilds[guild.id] = GuildEntities(guild)
+        return entities
+
+    def drop(self, guild: discord.Guild) -> None:
+        self.guilds.pop(guild.id, None)
+
+    def channel(self, guild: discord.Guild, name: str) -> Optional[GuildChannel]:
+        return self.get(guild).channel(name)
+
+    def role(self, guild: discord.Guild, name: str) -> Optional[discord.Role]:
+        return self.get(guild).role(name)
+
+    def category(
+        self, guild: discord.Guild, key: Union[int, str]
+    ) -> Optional[discord.CategoryChannel]:
+        return self.get(guild).category(key)
+
+
+class GuildIndexCog(commands.Cog):
+    def __init__(self, bot: commands.Bot, index: GuildIndex):
+        self.logger = logging.getLogger("bot")
+        self.bot = bot
+        self.index = index
+
+    @commands.Cog.listener(name="on_ready")
+    async def build(self):
+        for guild in self.bot.guilds:
+            self.index.rebuild(guild)
+        self.logger.info(f"Indexed entities for {len(self.bot.guilds)} guild(s)")
+
+    @commands.Cog.listener(name="on_guild_join")
+    async def guild_join(self, guild: discord.Guild):
+        self.index.rebuild(guild)
+
+    @commands.Cog.listener(name="on_guild_remove")
+    async def guild_remove(self, guild: discord.Guild):
+        self.index.drop(guild)
+
+    @commands.Cog.listener(name="on_guild_channel_create")
+    async def channel_create(self, channel: GuildChannel):
+        self.index.get(channel.guild).add_channel(channel)
+
+    @commands.Cog.listener(name="on_guild_channel_delete")
+    async def channel_delete(self, channel: GuildChannel):
+        self.index.get(channel.guild).remove_channel(channel)
+
+    @commands.Cog.listener(name="on_guild_channel_update")
+    async def channel_update(self, before: GuildChannel, after: GuildChannel):
+        entities = self.index.get(after.guild)
+        entities.remove_channel(before)
+        entities.add_channel(after)
+
+    @commands.Cog.listener(name="on_guild_role_create")
+    async def role_create(self, role: discord.Role):
+        self.index.get(role.guild).add_role(role)
+
+    @commands.Cog.listener(name="on_guild_role_delete")
+    async def role_delete(self, role: discord.Role):
+        self.index.get(role.guild).remove_role(role)
+
+    @commands.Cog.listener(name="on_guild_role_update")
+    async def role_update(self, before: discord.Role, after: discord.Role):
+        entities = self.index.get(after.guild)
+        entities.remove_role(before)
+        entities.add_role(after)
@@ -1,5 +1,12 @@
+import asyncio
 import json
-from typing import Dict
+import logging
+import os
+import tempfile
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, List, Optional
+
+from utils.snapshot import FrozenMap, Snapshot, VersionedMap
 
 
 def load_json_db(json_path: str) -> Dict[str, Dict]:
@@ -7,6 +14,248 @@ def load_json_db(json_path: str) -> Dict[str, Dict]:
         return json.loads(disk_lib.read())
 
 
-def dump_json_db(json_path: str, data: Dict[str, Dict]) -> None:
-    with open(json_path, "w", encoding="utf-8") as disk_lib:
-        disk_lib.write(json.dumps(data, sort_keys=True))
+def dump_json_db(json_path: str, data: Mapping, indent: Optional[int] = None) -> None:
+    """Writes to a temp file beside `json_path`, fsyncs it and renames it over."""
+    directory = os.path.dirname(json_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as disk_lib:
+            disk_lib.write(json.dumps(dict(data), sort_keys=True, indent=indent))
+            disk_lib.flush()
+            os.fsync(disk_lib.fileno())
+        os.replace(tmp_path, json_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+_stores: List["JsonStore"] = []
+
+MAX_RETRY_DELAY = 60.0
+
+
+class JsonStore(Mapping):
+    """
+    A JSON object file held in memory and written behind. Reads see the
+    current immutable snapshot; `set`/`delete` swap in a new version, mark the
+    store dirty and schedule a write `debounce` seconds later, so a burst of
+    changes costs one write. The write serializes whichever snapshot is
+    current off the event loop. Values are shared between versions, so they
+    must be replaced rather than mutated in place.
+    """
+
+    def __init__(self, path: str, indent: Optional[int] = None, debounce: float = 2.0):
+        self.logger = logging.getLogger("bot")
+        self.path = path
+        self.indent = indent
+        self.debounce = debounce
+        self.dirty = False
+        self.flush_task: Optional[asyncio.Task] = None
+        self.lock = asyncio.Lock()
+        self.versions = VersionedMap(self.load())
+        _stores.append(self)
+
+    def load(self) -> Dict[str, Any]:
+        try:
+            return load_json_db(self.path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        except json.decoder.JSONDecodeError:
+            pass
+        return {}
+
+    @property
+    def data(self) -> FrozenMap:
+        return self.versions.current.data
+
+    @property
+    def version(self) -> int:
+        return self.versions.version
+
+    def snapshot(self) -> Snapshot:
+        return self.versions.current
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def set(self, key: str, value: Any) -> None:
+        self.versions.set(key, value)
+        self.mark_dirty()
+
+    def delete(self, key: str) -> Any:
+        value = self.data.get(key)
+        self.versions.delete(key)
+        self.mark_dirty()
+        return value
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.get_running_loop().create_task(self.flush_later())
+
+    async def flush_later(self) -> None:
+        # Keep going while changes land during a write, and back off while
+        # writes are failing
+        delay = self.debounce
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self.flush()
+                delay = self.debounce
+            except Exception as error:
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                self.logger.error(
+                    f"Failed to write {self.path}, retrying in {delay:g}s: {error}"
+                )
+            if not self.dirty:
+                return
+
+    async def flush(self) -> None:
+        async with self.lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            try:
+                await self.write()
+            except Exception:
+                self.dirty = True
+                raise
+
+    async def write(self) -> None:
+        await asyncio.to_thread(dump_json_db, self.path, self.data, self.indent)
+
+    async def close(self) -> None:
+        # The lock makes this wait out a write already in progress
+        await self.flush()
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+
+
+def append_journal(journal_path: str, records: List[list]) -> int:
+    lines = "".join(
+        json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+        for record in records
+    ).encode("utf-8")
+    with open(journal_path, "ab") as journal:
+        journal.write(lines)
+        journal.flush()
+        os.fsync(journal.fileno())
+    return len(lines)
+
+
+def replay_journal(journal_path: str, data: Dict[str, Any]) -> int:
+    """
+    Applies journal records to `data` and returns the journal's size. A torn
+    final line from a crash mid-append is cut off so later appends stay
+    readable.
+    """
+    try:
+        journal = open(journal_path, "r+b")
+    except FileNotFoundError:
+        return 0
+    with journal:
+        good = 0
+        for line in journal:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                op, key, *value = json.loads(line)
+            except ValueError:
+                break
+            if op == "s":
+                data[key] = value[0]
+            else:
+                data.pop(key, None)
+            good += len(line)
+        journal.truncate(good)
+    return good
+
+
+class JournalStore(JsonStore):
+    """
+    JsonStore that appends each change to `<path>.journal` instead of
+    rewriting the file, so a write costs the size of the change. The JSON file
+    becomes a snapshot that startup replays the journal on top of; once the
+    journal passes `compact_bytes` a fresh snapshot is written and the journal
+    emptied. The snapshot stays in the plain JsonStore format, so the two
+    modes can be switched between.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        indent: Optional[int] = None,
+        debounce: float = 2.0,
+        compact_bytes: int = 1024 * 1024,
+    ):
+        self.journal_path = path + ".journal"
+        self.compact_bytes = compact_bytes
+        self.pending: List[list] = []
+        self.journal_bytes = 0
+        super().__init__(path, indent, debounce)
+
+    def load(self) -> Dict[str, Any]:
+        data = super().load()
+        self.journal_bytes = replay_journal(self.journal_path, data)
+        return data
+
+    def set(self, key: str, value: Any) -> None:
+        self.pending.append(["s", key, value])
+        super().set(key, value)
+
+    def delete(self, key: str) -> Any:
+        self.pending.append(["d", key])
+        return super().delete(key)
+
+    async def append_pending(self) -> None:
+        records, self.pending = self.pending, []
+        if not records:
+            return
+        try:
+            self.journal_bytes += await asyncio.to_thread(
+                append_journal, self.journal_path, records
+            )
+        except Exception:
+            self.pending = records + self.pending
+            raise
+
+    async def write(self) -> None:
+        await self.append_pending()
+        if self.journal_bytes < self.compact_bytes:
+            return
+        # Take the snapshot and drain in the same step, so the journal covers
+        # everything in the snapshot and replaying it over the snapshot is
+        # harmless if we die before truncating
+        snapshot = self.data
+        await self.append_pending()
+        await asyncio.to_thread(dump_json_db, self.path, snapshot, self.indent)
+        await asyncio.to_thread(os.truncate, self.journal_path, 0)
+        self.logger.info(
+            f"Compacted {self.journal_bytes} byte journal into {self.path}"
+        )
+        self.journal_bytes = 0
+
+
+def open_store(path: str, indent: Optional[int] = None) -> JsonStore:
+    """A JsonStore, or a JournalStore when STORAGE_MODE=journal."""
+    if os.getenv("STORAGE_MODE", "json").lower() == "journal":
+        return JournalStore(
+            path,
+            indent,
+            compact_bytes=int(os.getenv("JOURNAL_COMPACT_BYTES", str(1024 * 1024))),
+        )
+    return JsonStore(path, indent)
+
+
+async def close_all_stores() -> None:
+    for store in _stores:
+        try:
+            await store.close()
+        except Exception as error:
+            store.logger.error(f"Failed to write {store.path} on shutdown: {error}")
@@ -0,0 +1,70 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class Standing(NamedTuple):
+    name: str
+    score: float
+    votes: int
+
+
+class Leaderboard:
+    """
+    Submissions ordered by one field's average, kept in two sorted lists so
+    the best and worst are both read from the front. Equal scores order by
+    name in either direction. Only submissions with at least one vote for
+    the field are ranked.
+    """
+
+    def __init__(self):
+        self.entries: Dict[str, Tuple[float, int]] = {}
+        self.ascending: List[Tuple[float, str]] = []
+        self.descending: List[Tuple[float, str]] = []
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def set(self, name: str, score: float, votes: int) -> None:
+        self.remove(name)
+        if votes <= 0:
+            return
+        self.entries[name] = (score, votes)
+        insort(self.ascending, (score, name))
+        insort(self.descending, (-score, name))
+
+    def remove(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry is None:
+            return
+        score = entry[0]
+        del self.ascending[bisect_left(self.ascending, (score, name))]
+        del self.descending[bisect_left(self.descending, (-score, name))]
+
+    def rename(self, name: str, new_name: str) -> None:
+        entry = self.entries.get(name)
+        if entry is not None:
+            self.remove(name)
+            self.set(new_name, *entry)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.ascending.clear()
+        self.descending.clear()
+
+    def top(self, count: int, min_votes: int = 1) -> List[Standing]:
+        return self._take(self.descending, count, min_votes)
+
+    def bottom(self, count: int, min_votes: int = 1) -> List[Standing]:
+        return self._take(self.ascending, count, min_votes)
+
+    def _take(
+        self, order: List[Tuple[float, str]], count: int, min_votes: int
+    ) -> List[Standing]:
+        standings = []
+        for _, name in order:
+            if len(standings) >= count:
+                break
+            score, votes = self.entries[name]
+            if votes >= min_votes:
+                standings.append(Standing(name, score, votes))
+        return standings
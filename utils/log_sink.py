@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import discord
+
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+
+
+class LogSink:
+    """
+    Buffers log embeds per channel and sends them in batches of up to ten per
+    message on a short timer, instead of one message per event. Each channel's
+    buffer is bounded; embeds arriving at a full buffer are dropped and
+    counted. At most `max_messages` batches go to a channel per tick, so a
+    flood of events drains over several ticks rather than hammering the rate
+    limit.
+    """
+
+    def __init__(
+        self, interval: float = 2.0, max_pending: int = 500, max_messages: int = 3
+    ):
+        self.logger = logging.getLogger("bot")
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_messages = max_messages
+        self.channels: Dict[int, discord.abc.Messageable] = {}
+        self.pending: Dict[int, Deque[discord.Embed]] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.queued = 0
+        self.sent_embeds = 0
+        self.sent_messages = 0
+        self.dropped = 0
+        self.failed = 0
+
+    @classmethod
+    def from_env(cls) -> "LogSink":
+        return cls(
+            interval=float(os.getenv("LOG_SINK_INTERVAL", "2")),
+            max_pending=int(os.getenv("LOG_SINK_MAX_PENDING", "500")),
+            max_messages=int(os.getenv("LOG_SINK_MAX_MESSAGES", "3")),
+        )
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def close(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Last chance for whatever is still buffered, ignoring the per-tick cap
+        await self.flush(max_messages=None)
+
+    def submit(self, channel: discord.abc.Messageable, embed: discord.Embed) -> bool:
+        queue = self.pending.get(channel.id)
+        if queue is None:
+            queue = self.pending[channel.id] = deque()
+            self.channels[channel.id] = channel
+        if len(queue) >= self.max_pending:
+            self.dropped += 1
+            return False
+        queue.append(embed)
+        self.queued += 1
+        return True
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush(self.max_messages)
+            except Exception as error:
+                self.logger.error(f"Log sink flush failed: {error}")
+
+    async def flush(self, max_messages: Optional[int]) -> None:
+        for channel_id, queue in list(self.pending.items()):
+            sent = 0
+            while queue and (max_messages is None or sent < max_messages):
+                batch = take_batch(queue)
+                try:
+                    await self.channels[channel_id].send(embeds=batch)
+                except discord.HTTPException as error:
+                    self.failed += len(batch)
+                    self.logger.warning(
+                        f"Dropped {len(batch)} log embeds for channel {channel_id}: {error}"
+                    )
+                    break
+                self.sent_embeds += len(batch)
+                self.sent_messages += 1
+                sent += 1
+            if not queue:
+                del self.pending[channel_id]
+                del self.channels[channel_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": sum(len(queue) for queue in self.pending.values()),
+            "queued": self.queued,
+            "sent_embeds": self.sent_embeds,
+            "sent_messages": self.sent_messages,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+def take_batch(queue: Deque[discord.Embed]) -> List[discord.Embed]:
+    """Pops up to ten embeds that fit together under Discord's per-message size limit."""
+    batch = [queue.popleft()]
+    chars = len(batch[0])
+    while queue and len(batch) < EMBEDS_PER_MESSAGE:
+        size = len(queue[0])
+        if chars + size > EMBED_CHARS_PER_MESSAGE:
+            break
+        batch.append(queue.popleft())
+        chars += size
+    return batch
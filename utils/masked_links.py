@@ -0,0 +1,24 @@
+import re
+from typing import List, NamedTuple
+
+# Every repeat is possessive and each piece starts with a character the piece
+# after it cannot, so no match attempt ever gives characters back and the scan
+# is linear in the message length, whitespace runs included. The mask may hold
+# one level of [...], the URL one level of balanced (...), optionally wrapped
+# in Discord's <...> embed-suppression form and followed by a quoted title.
+MASKED_LINK = re.compile(
+    r"\[((?:[^\[\]\n]|\[[^\[\]\n]*+\])++)\]"
+    r"\(\s*+<?((?:[^()<>\s]|\([^()<>\s]*+\))*+)>?"
+    r"(?:\s++(?:\"[^\"\n]*+\"|'[^'\n]*+'))?\s*+\)"
+)
+
+
+class MaskedLink(NamedTuple):
+    mask: str
+    url: str
+
+
+def find_masked_links(content: str) -> List[MaskedLink]:
+    if "](" not in content:
+        return []
+    return [MaskedLink(*match.groups()) for match in MASKED_LINK.finditer(content)]
@@ -0,0 +1,131 @@
+import os
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional, Tuple
+
+import discord
+
+# Rough fixed cost of a record plus its index entry, on top of the text it holds
+RECORD_OVERHEAD = 200
+
+
+class StoredMessage:
+    __slots__ = ("id", "author_id", "channel_id", "content", "attachments")
+
+    def __init__(
+        self,
+        id: int,
+        author_id: int,
+        channel_id: int,
+        content: str,
+        attachments: Tuple[str, ...],
+    ):
+        self.id = id
+        self.author_id = author_id
+        self.channel_id = channel_id
+        self.content = content
+        self.attachments = attachments
+
+    @classmethod
+    def from_message(cls, message: discord.Message) -> "StoredMessage":
+        return cls(
+            message.id,
+            message.author.id,
+            message.channel.id,
+            message.content,
+            tuple(att.url or att.proxy_url for att in message.attachments),
+        )
+
+    @property
+    def size(self) -> int:
+        return (
+            RECORD_OVERHEAD
+            + len(self.content)
+            + sum(len(url) for url in self.attachments)
+        )
+
+
+class MessageStore:
+    """
+    Recent messages kept so deletions can be logged from raw delete events,
+    which unlike on_message_delete fire for messages discord.py never cached.
+    Each channel is a ring buffer of at most `per_channel` records and the
+    whole store stays under `max_bytes`, evicting from the largest channel
+    first. Deleted records are dropped from the index straight away and
+    their ring slot is reclaimed on the next eviction.
+    """
+
+    def __init__(self, per_channel: int = 1000, max_bytes: int = 32 * 1024 * 1024):
+        self.per_channel = per_channel
+        self.max_bytes = max_bytes
+        self.rings: Dict[int, Deque[StoredMessage]] = {}
+        self.channel_bytes: Dict[int, int] = {}
+        self.index: Dict[int, StoredMessage] = {}
+        self.bytes = 0
+
+    @classmethod
+    def from_env(cls) -> "MessageStore":
+        return cls(
+            per_channel=int(os.getenv("MESSAGE_STORE_PER_CHANNEL", "1000")),
+            max_bytes=int(os.getenv("MESSAGE_STORE_MAX_BYTES", str(32 * 1024 * 1024))),
+        )
+
+    def add(self, message: discord.Message) -> None:
+        record = StoredMessage.from_message(message)
+        ring = self.rings.get(record.channel_id)
+        if ring is None:
+            ring = self.rings[record.channel_id] = deque()
+            self.channel_bytes[record.channel_id] = 0
+        if len(ring) >= self.per_channel:
+            self._evict(ring.popleft())
+        ring.append(record)
+        self.index[record.id] = record
+        self._account(record, record.size)
+        while self.bytes > self.max_bytes:
+            largest = max(self.channel_bytes, key=self.channel_bytes.get)
+            self._evict(self.rings[largest].popleft())
+            if not self.rings[largest]:
+                del self.rings[largest]
+                del self.channel_bytes[largest]
+
+    def edit(self, message_id: int, content: str) -> None:
+        record = self.index.get(message_id)
+        if record is not None:
+            self._account(record, len(content) - len(record.content))
+            record.content = content
+
+    def pop(self, message_id: int) -> Optional[StoredMessage]:
+        record = self.index.pop(message_id, None)
+        if record is None:
+            return None
+        popped = StoredMessage(
+            record.id,
+            record.author_id,
+            record.channel_id,
+            record.content,
+            record.attachments,
+        )
+        # Leave an empty shell in the ring rather than an O(n) removal
+        self._account(record, RECORD_OVERHEAD - record.size)
+        record.content = ""
+        record.attachments = ()
+        return popped
+
+    def pop_many(self, message_ids: Iterable[int]) -> List[StoredMessage]:
+        records = (self.pop(message_id) for message_id in message_ids)
+        return sorted((r for r in records if r is not None), key=lambda r: r.id)
+
+    def _evict(self, record: StoredMessage) -> None:
+        if self.index.get(record.id) is record:
+            del self.index[record.id]
+        self._account(record, -record.size)
+
+    def _account(self, record: StoredMessage, delta: int) -> None:
+        self.bytes += delta
+        self.channel_bytes[record.channel_id] += delta
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "messages": len(self.index),
+            "channels": len(self.rings),
+            "bytes": self.bytes,
+        }
@@ -0,0 +1,496 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from utils.autocomplete import AutocompleteIndex
+from utils.leaderboard import Leaderboard, Standing
+
+# Display name -> (rating column, average column)
+FIELDS = {
+    "Instrumentals": ("ins", "avg_ins"),
+    "Vocals": ("voc", "avg_voc"),
+    "Lyrics": ("lyr", "avg_lyr"),
+    "Emotion/Feeling": ("emo", "avg_emo"),
+    "Overall": ("ovr", "avg_ovr"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    content TEXT NOT NULL,
+    avg_ins REAL NOT NULL DEFAULT 0,
+    avg_voc REAL NOT NULL DEFAULT 0,
+    avg_lyr REAL NOT NULL DEFAULT 0,
+    avg_emo REAL NOT NULL DEFAULT 0,
+    avg_ovr REAL NOT NULL DEFAULT 0,
+    sum_ins INTEGER NOT NULL DEFAULT 0,
+    cnt_ins INTEGER NOT NULL DEFAULT 0,
+    sum_voc INTEGER NOT NULL DEFAULT 0,
+    cnt_voc INTEGER NOT NULL DEFAULT 0,
+    sum_lyr INTEGER NOT NULL DEFAULT 0,
+    cnt_lyr INTEGER NOT NULL DEFAULT 0,
+    sum_emo INTEGER NOT NULL DEFAULT 0,
+    cnt_emo INTEGER NOT NULL DEFAULT 0,
+    sum_ovr INTEGER NOT NULL DEFAULT 0,
+    cnt_ovr INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    id INTEGER PRIMARY KEY,
+    submission_id INTEGER NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    user_id INTEGER,
+    user_name TEXT NOT NULL,
+    ins INTEGER,
+    voc INTEGER,
+    lyr INTEGER,
+    emo INTEGER,
+    ovr INTEGER NOT NULL,
+    comments TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ratings_submission ON ratings(submission_id);
+CREATE INDEX IF NOT EXISTS ratings_user_id ON ratings(user_id, submission_id);
+CREATE INDEX IF NOT EXISTS ratings_user_name ON ratings(user_name, submission_id);
+-- Extremes are served from in-memory leaderboards now
+DROP INDEX IF EXISTS submissions_avg_ins;
+DROP INDEX IF EXISTS submissions_avg_voc;
+DROP INDEX IF EXISTS submissions_avg_lyr;
+DROP INDEX IF EXISTS submissions_avg_emo;
+DROP INDEX IF EXISTS submissions_avg_ovr;
+"""
+
+RATING_COLUMNS = ("ins", "voc", "lyr", "emo")
+COLUMNS = (*RATING_COLUMNS, "ovr")
+
+# Each submission carries a running sum and count per field; an N/A rating
+# is left out of both, so averages are over the ratings that gave a score
+APPLY_DELTAS = (
+    "UPDATE submissions SET "
+    + ", ".join(f"sum_{c} = sum_{c} + ?, cnt_{c} = cnt_{c} + ?" for c in COLUMNS)
+    + " WHERE id = ?"
+)
+SET_AVERAGES = "UPDATE submissions SET " + ", ".join(
+    f"avg_{c} = CASE WHEN cnt_{c} > 0 THEN CAST(sum_{c} AS REAL) / cnt_{c} ELSE 0 END"
+    for c in COLUMNS
+)
+REBUILD_TOTALS = "UPDATE submissions SET " + ", ".join(
+    f"sum_{c} = (SELECT COALESCE(SUM({c}), 0) FROM ratings r WHERE r.submission_id = submissions.id), "
+    f"cnt_{c} = (SELECT COUNT({c}) FROM ratings r WHERE r.submission_id = submissions.id)"
+    for c in COLUMNS
+)
+ACTUAL_TOTALS = (
+    "SELECT s.id, s.name, "
+    + ", ".join(f"s.sum_{c}, s.cnt_{c}" for c in COLUMNS)
+    + ", "
+    + ", ".join(
+        f"COALESCE(t.sum_{c}, 0) AS real_sum_{c}, COALESCE(t.cnt_{c}, 0) AS real_cnt_{c}"
+        for c in COLUMNS
+    )
+    + " FROM submissions s LEFT JOIN (SELECT submission_id, "
+    + ", ".join(f"SUM({c}) AS sum_{c}, COUNT({c}) AS cnt_{c}" for c in COLUMNS)
+    + " FROM ratings GROUP BY submission_id) t ON t.submission_id = s.id"
+)
+
+# Ratings the user made before ratings were keyed by ID only carry their name
+USER_MATCH = "(user_id = ? OR (user_id IS NULL AND user_name = ?))"
+
+
+class RatingDB:
+    """
+    Ratings in SQLite (WAL). The connection lives on one dedicated worker
+    thread and every query is shipped there, so callers on the event loop just
+    await the result and never touch sqlite3 directly. Submission names are
+    mirrored into an AutocompleteIndex, and each field's averages into a
+    Leaderboard, on the loop side as they change.
+    """
+
+    def __init__(self, path: str, json_path: Optional[str] = None):
+        self.logger = logging.getLogger("bot")
+        self.path = path
+        self.json_path = json_path
+        self.worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ratings")
+        self.conn: Optional[sqlite3.Connection] = None
+        self.index = AutocompleteIndex()
+        self.boards = {field: Leaderboard() for field in FIELDS}
+
+    @classmethod
+    def from_env(cls) -> "RatingDB":
+        return cls(
+            os.getenv("RATING_DB_PATH", "json/ratings.db"),
+            json_path="json/ratings.json",
+        )
+
+    async def run(self, fn: Callable[..., Any], *args) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self.worker, fn, *args)
+
+    async def open(self) -> None:
+        await self.run(self._open)
+        self.index = AutocompleteIndex(name for name, _ in await self.listing())
+        await self.load_boards()
+
+    async def close(self) -> None:
+        if self.conn is not None:
+            await self.run(self.conn.close)
+            self.conn = None
+        self.worker.shutdown(wait=True)
+
+    def _open(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+        self._add_totals()
+        self._migrate_json()
+
+    def _add_totals(self) -> None:
+        """Adds and fills the running totals on databases created without them."""
+        existing = {
+            row["name"] for row in self.conn.execute("PRAGMA table_info(submissions)")
+        }
+        missing = [
+            f"{kind}_{c}"
+            for c in COLUMNS
+            for kind in ("sum", "cnt")
+            if f"{kind}_{c}" not in existing
+        ]
+        if not missing:
+            return
+        with self.conn:
+            for column in missing:
+                self.conn.execute(
+                    f"ALTER TABLE submissions ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0"
+                )
+            self.conn.execute(REBUILD_TOTALS)
+            self.conn.execute(SET_AVERAGES)
+        self.logger.info("Added running rating totals to the submissions table")
+
+    def _migrate_json(self) -> None:
+        """One-shot import of the old ratings JSON into an empty database."""
+        if not self.json_path or not os.path.exists(self.json_path):
+            return
+        if self.conn.execute("SELECT 1 FROM submissions LIMIT 1").fetchone():
+            return
+        try:
+            with open(self.json_path, "r", encoding="utf-8") as disk_lib:
+                data = json.loads(disk_lib.read())
+        except json.decoder.JSONDecodeError:
+            data = {}
+        with self.conn:
+            for name, entry in data.items():
+                submission_id = self.conn.execute(
+                    "INSERT INTO submissions (name, content) VALUES (?, ?)",
+                    (name, entry.get("content", "")),
+                ).lastrowid
+                for user_name, values in entry.get("ratings", {}).items():
+                    self.conn.execute(
+                        "INSERT INTO ratings (submission_id, user_name, ins, voc, lyr, emo, ovr, comments)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (
+                            submission_id,
+                            user_name,
+                            *(
+                                _score(values[field])
+                                for field in FIELDS
+                                if field != "Overall"
+                            ),
+                            int(values["Overall"]),
+                            values.get("Comments") or "",
+                        ),
+                    )
+            self.conn.execute(REBUILD_TOTALS)
+            self.conn.execute(SET_AVERAGES)
+        os.replace(self.json_path, self.json_path + ".migrated")
+        self.logger.info(
+            f"Migrated {len(data)} rating submissions from {self.json_path} to {self.path}"
+        )
+
+    def _apply(
+        self, submission_id: int, old: Optional[tuple], new: Optional[tuple]
+    ) -> None:
+        """
+        Moves a submission's totals from rating `old` to rating `new` (either
+        may be None for an added or removed rating) and refreshes its averages.
+        """
+        deltas = []
+        for i in range(len(COLUMNS)):
+            before = old[i] if old is not None else None
+            after = new[i] if new is not None else None
+            deltas.append((after or 0) - (before or 0))
+            deltas.append((after is not None) - (before is not None))
+        self.conn.execute(APPLY_DELTAS, (*deltas, submission_id))
+        self.conn.execute(SET_AVERAGES + " WHERE id = ?", (submission_id,))
+
+    def _submission_id(self, name: str) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT id FROM submissions WHERE name = ?", (name,)
+        ).fetchone()
+        return row["id"] if row else None
+
+    # Queries, run on the worker thread through the async wrappers below
+
+    def _exists(self, name: str) -> bool:
+        return self._submission_id(name) is not None
+
+    def _add_submission(self, name: str, content: str) -> bool:
+        try:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT INTO submissions (name, content) VALUES (?, ?)",
+                    (name, content),
+                )
+        except sqlite3.IntegrityError:
+            return False
+        return True
+
+    def _rate(
+        self,
+        name: str,
+        user_id: int,
+        user_name: str,
+        scores: List[Optional[int]],
+        overall: int,
+        comments: str,
+    ) -> Optional[Dict[str, Tuple[float, int]]]:
+        with self.conn:
+            submission_id = self._submission_id(name)
+            if submission_id is None:
+                return None
+            new = (*scores, overall)
+            old_rows = self.conn.execute(
+                "SELECT ins, voc, lyr, emo, ovr FROM ratings"
+                f" WHERE submission_id = ? AND {USER_MATCH}",
+                (submission_id, user_id, user_name),
+            ).fetchall()
+            values = (user_id, user_name, *new, comments)
+            if old_rows:
+                self.conn.execute(
+                    "UPDATE ratings SET user_id = ?, user_name = ?, ins = ?, voc = ?, lyr = ?, emo = ?,"
+                    f" ovr = ?, comments = ? WHERE submission_id = ? AND {USER_MATCH}",
+                    (*values, submission_id, user_id, user_name),
+                )
+            else:
+                self.conn.execute(
+                    "INSERT INTO ratings (user_id, user_name, ins, voc, lyr, emo, ovr, comments, submission_id)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*values, submission_id),
+                )
+            for old in old_rows or [None]:
+                self._apply(submission_id, tuple(old) if old else None, new)
+        return self._standings(submission_id)[name]
+
+    def _drop(self, name: str) -> None:
+        with self.conn:
+            self.conn.execute("DELETE FROM submissions WHERE name = ?", (name,))
+
+    def _rename(self, name: str, new_name: str) -> bool:
+        try:
+            with self.conn:
+                return bool(
+                    self.conn.execute(
+                        "UPDATE submissions SET name = ? WHERE name = ?",
+                        (new_name, name),
+                    ).rowcount
+                )
+        except sqlite3.IntegrityError:
+            return False
+
+    def _verify(self) -> List[Tuple[str, str, Tuple[int, int], Tuple[int, int]]]:
+        """
+        Checks every submission's running totals against its ratings and
+        repairs any that drifted. Returns (name, field, stored sum/count,
+        actual sum/count) for each repaired field.
+        """
+        drift = []
+        drifted_ids = set()
+        for row in self.conn.execute(ACTUAL_TOTALS).fetchall():
+            for field, (column, _) in FIELDS.items():
+                stored = (row[f"sum_{column}"], row[f"cnt_{column}"])
+                actual = (row[f"real_sum_{column}"], row[f"real_cnt_{column}"])
+                if stored != actual:
+                    drift.append((row["name"], field, stored, actual))
+                    drifted_ids.add(row["id"])
+        if drifted_ids:
+            marks = ", ".join("?" * len(drifted_ids))
+            with self.conn:
+                self.conn.execute(
+                    f"{REBUILD_TOTALS} WHERE id IN ({marks})", tuple(drifted_ids)
+                )
+                self.conn.execute(
+                    f"{SET_AVERAGES} WHERE id IN ({marks})", tuple(drifted_ids)
+                )
+        return drift
+
+    def _standings(
+        self, submission_id: Optional[int] = None
+    ) -> Dict[str, Dict[str, Tuple[float, int]]]:
+        """Each submission's (average, vote count) per field."""
+        query = "SELECT * FROM submissions"
+        params: tuple = ()
+        if submission_id is not None:
+            query += " WHERE id = ?"
+            params = (submission_id,)
+        return {
+            row["name"]: {
+                field: (row[average], row[f"cnt_{column}"])
+                for field, (column, average) in FIELDS.items()
+            }
+            for row in self.conn.execute(query, params)
+        }
+
+    def _averages(self, name: str) -> Optional[Dict[str, float]]:
+        row = self.conn.execute(
+            "SELECT * FROM submissions WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {field: row[average] for field, (_, average) in FIELDS.items()}
+
+    def _comments(self, name: str) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT r.comments FROM ratings r JOIN submissions s ON s.id = r.submission_id"
+            " WHERE s.name = ? AND r.comments != '' ORDER BY r.id",
+            (name,),
+        ).fetchall()
+        return [row["comments"] for row in rows]
+
+    def _listing(self) -> List[Tuple[str, str]]:
+        rows = self.conn.execute(
+            "SELECT name, content FROM submissions ORDER BY id"
+        ).fetchall()
+        return [(row["name"], row["content"]) for row in rows]
+
+    def _todo(self, user_id: int, user_name: str) -> List[Tuple[str, str]]:
+        rows = self.conn.execute(
+            "SELECT name, content FROM submissions s"
+            " WHERE NOT EXISTS (SELECT 1 FROM ratings r"
+            "   WHERE r.user_id = ? AND r.submission_id = s.id)"
+            " AND NOT EXISTS (SELECT 1 FROM ratings r"
+            "   WHERE r.user_name = ? AND r.user_id IS NULL AND r.submission_id = s.id)"
+            " ORDER BY s.id",
+            (user_id, user_name),
+        ).fetchall()
+        return [(row["name"], row["content"]) for row in rows]
+
+    def _field_scores(self, field: str) -> List[Tuple[str, float]]:
+        column = FIELDS[field][1]
+        rows = self.conn.execute(
+            f"SELECT name, {column} AS score FROM submissions ORDER BY id"
+        ).fetchall()
+        return [(row["name"], row["score"]) for row in rows]
+
+    def _export(self) -> Dict[str, Dict]:
+        """The whole database in the old ratings.json layout."""
+        data = {}
+        for row in self.conn.execute("SELECT * FROM submissions ORDER BY id"):
+            entry = {"content": row["content"], "ratings": {}}
+            for _, average in FIELDS.values():
+                entry[average] = row[average]
+            data[row["name"]] = entry
+            ratings = self.conn.execute(
+                "SELECT * FROM ratings WHERE submission_id = ? ORDER BY id",
+                (row["id"],),
+            )
+            for rating in ratings:
+                entry["ratings"][rating["user_name"]] = {
+                    **{
+                        field: _display(rating[column])
+                        for field, (column, _) in FIELDS.items()
+                    },
+                    "Comments": rating["comments"],
+                }
+        return data
+
+    async def exists(self, name: str) -> bool:
+        return await self.run(self._exists, name)
+
+    async def add_submission(self, name: str, content: str) -> bool:
+        added = await self.run(self._add_submission, name, content)
+        if added:
+            self.index.add(name)
+        return added
+
+    async def rate(
+        self,
+        name: str,
+        user_id: int,
+        user_name: str,
+        scores: List[Optional[int]],
+        overall: int,
+        comments: str,
+    ) -> bool:
+        standing = await self.run(
+            self._rate, name, user_id, user_name, scores, overall, comments
+        )
+        if standing is None:
+            return False
+        for field, (score, votes) in standing.items():
+            self.boards[field].set(name, score, votes)
+        return True
+
+    async def drop(self, name: str) -> None:
+        await self.run(self._drop, name)
+        self.index.remove(name)
+        for board in self.boards.values():
+            board.remove(name)
+
+    async def rename(self, name: str, new_name: str) -> bool:
+        renamed = await self.run(self._rename, name, new_name)
+        if renamed:
+            self.index.rename(name, new_name)
+            for board in self.boards.values():
+                board.rename(name, new_name)
+        return renamed
+
+    async def verify(self) -> List[Tuple[str, str, Tuple[int, int], Tuple[int, int]]]:
+        drift = await self.run(self._verify)
+        if drift:
+            await self.load_boards()
+        return drift
+
+    async def load_boards(self) -> None:
+        standings = await self.run(self._standings)
+        for board in self.boards.values():
+            board.clear()
+        for name, fields in standings.items():
+            for field, (score, votes) in fields.items():
+                self.boards[field].set(name, score, votes)
+
+    def ranked(
+        self, field: str, count: int, highest: bool, min_votes: int = 1
+    ) -> List[Standing]:
+        board = self.boards[field]
+        if highest:
+            return board.top(count, min_votes)
+        return board.bottom(count, min_votes)
+
+    async def averages(self, name: str) -> Optional[Dict[str, float]]:
+        return await self.run(self._averages, name)
+
+    async def comments(self, name: str) -> List[str]:
+        return await self.run(self._comments, name)
+
+    async def listing(self) -> List[Tuple[str, str]]:
+        return await self.run(self._listing)
+
+    async def todo(self, user_id: int, user_name: str) -> List[Tuple[str, str]]:
+        return await self.run(self._todo, user_id, user_name)
+
+    async def field_scores(self, field: str) -> List[Tuple[str, float]]:
+        return await self.run(self._field_scores, field)
+
+    async def export(self) -> Dict[str, Dict]:
+        return await self.run(self._export)
+
+
+def _score(value) -> Optional[int]:
+    return None if value == "N/A" else int(value)
+
+
+def _display(value: Optional[int]):
+    return "N/A" if value is None else value
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional
+
+
+class VoteRule(NamedTuple):
+    emoji: str
+    threshold: int
+
+
+class ReactionTally:
+    """
+    Counts vote reactions per message from raw gateway events, so the API is
+    only asked about a message once its local count reaches the channel's
+    threshold. Entries expire `ttl` seconds after their last vote and the
+    stalest are evicted past `max_entries`. Votes from before the bot started
+    are missed, so the local count can only lag the real one; the fetch at the
+    threshold is what decides.
+    """
+
+    def __init__(
+        self,
+        default: VoteRule,
+        channels: Optional[Dict[int, VoteRule]] = None,
+        ttl: float = 6 * 3600,
+        max_entries: int = 10_000,
+    ):
+        self.logger = logging.getLogger("bot")
+        self.default = default
+        self.channels = channels or {}
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # message id -> (expiry, count)
+        self.counts: "OrderedDict[int, tuple]" = OrderedDict()
+        self.checks = 0
+
+    @classmethod
+    def from_env(cls) -> "ReactionTally":
+        path = os.getenv("REACTION_VOTES_PATH", "data/reaction_votes.json")
+        with open(path, "r", encoding="utf-8") as fp:
+            config = json.load(fp)
+        default = VoteRule(**config["default"])
+        channels = {
+            int(channel_id): VoteRule(**{**default._asdict(), **rule})
+            for channel_id, rule in config.get("channels", {}).items()
+        }
+        return cls(
+            default,
+            channels,
+            ttl=float(os.getenv("REACTION_TALLY_TTL", str(6 * 3600))),
+            max_entries=int(os.getenv("REACTION_TALLY_MAX_ENTRIES", "10000")),
+        )
+
+    def rule(self, channel_id: int) -> VoteRule:
+        return self.channels.get(channel_id, self.default)
+
+    def add(self, channel_id: int, message_id: int, emoji: str) -> bool:
+        """Records a vote; True when the local count has reached the threshold."""
+        rule = self.rule(channel_id)
+        if emoji != rule.emoji:
+            return False
+        now = time.monotonic()
+        expiry, count = self.counts.pop(message_id, (now, 0))
+        count = count + 1 if expiry > now else 1
+        self.counts[message_id] = (now + self.ttl, count)
+        self.evict(now)
+        if count >= rule.threshold:
+            self.checks += 1
+            return True
+        return False
+
+    def remove(self, channel_id: int, message_id: int, emoji: str) -> None:
+        if emoji != self.rule(channel_id).emoji:
+            return
+        entry = self.counts.get(message_id)
+        if entry is not None:
+            self.counts[message_id] = (entry[0], max(0, entry[1] - 1))
+
+    def sync(self, message_id: int, count: int) -> None:
+        """Replaces the local count with the count the API reported."""
+        entry = self.counts.get(message_id)
+        if entry is not None:
+            self.counts[message_id] = (entry[0], count)
+
+    def forget(self, message_id: int) -> None:
+        self.counts.pop(message_id, None)
+
+    def evict(self, now: float) -> None:
+        # Every vote re-inserts its entry, so the front holds the soonest expiry
+        while self.counts:
+            message_id, (expiry, _) = next(iter(self.counts.items()))
+            if expiry > now and len(self.counts) <= self.max_entries:
+                break
+            del self.counts[message_id]
+
+    def stats(self) -> Dict[str, int]:
+        return {"tracked": len(self.counts), "checks": self.checks}
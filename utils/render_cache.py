@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class RenderCache:
+    """
+    Content-addressed LRU for rendered meme output, bounded by total bytes.
+    Keys are derived from everything the output depends on (avatar asset key,
+    template, text/emoji), so a changed avatar naturally misses. An optional
+    on-disk tier keeps entries across restarts. Misses are single-flight per
+    key: only the first caller renders and stores, the rest await its result.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 32 * 1024 * 1024,
+        disk_path: Optional[str] = None,
+        disk_max_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.logger = logging.getLogger("bot")
+        self.max_bytes = max_bytes
+        self.disk_path = disk_path
+        self.disk_max_bytes = disk_max_bytes
+        self.entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.in_flight: Dict[str, asyncio.Future] = {}
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.disk_path and not os.path.exists(self.disk_path):
+            os.makedirs(self.disk_path)
+
+    @classmethod
+    def from_env(cls) -> "RenderCache":
+        return cls(
+            max_bytes=int(os.getenv("RENDER_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+            disk_path=os.getenv("RENDER_CACHE_DIR") or None,
+            disk_max_bytes=int(
+                os.getenv("RENDER_CACHE_DISK_MAX_BYTES", 256 * 1024 * 1024)
+            ),
+        )
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256(
+            "\x1f".join(str(part) for part in parts).encode("utf-8")
+        ).hexdigest()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return data
+        if self.disk_path:
+            data = await asyncio.to_thread(self._read_disk, key)
+            if data is not None:
+                self.disk_hits += 1
+                self._put_memory(key, data)
+                return data
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        self._put_memory(key, data)
+        if self.disk_path:
+            await asyncio.to_thread(self._write_disk, key, data)
+
+    async def get_or_render(
+        self, key: str, render: Callable[[], Awaitable[bytes]]
+    ) -> bytes:
+        data = await self.get(key)
+        if data is not None:
+            return data
+        shared = self.in_flight.get(key)
+        if shared is not None:
+            return await asyncio.shield(shared)
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            data = await render()
+            future.set_result(data)
+            await self.put(key, data)
+            return data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            if not future.done():
+                future.set_exception(error)
+                future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+        }
+
+    def _put_memory(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _disk_file(self, key: str) -> str:
+        return os.path.join(self.disk_path, key)
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        fn = self._disk_file(key)
+        try:
+            with open(fn, "rb") as fp:
+                data = fp.read()
+        except FileNotFoundError:
+            return None
+        os.utime(fn)  # bump mtime so pruning is least-recently-used
+        return data
+
+    def _write_disk(self, key: str, data: bytes) -> None:
+        # A unique temp file per write, so two writers never rename each other's
+        fd, tmp = tempfile.mkstemp(dir=self.disk_path, prefix=key, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(data)
+            os.replace(tmp, self._disk_file(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._prune_disk()
+
+    def _prune_disk(self) -> None:
+        files = []
+        total = 0
+        for entry in os.scandir(self.disk_path):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        files.sort()
+        for _, size, path in files:
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError as error:
+                self.logger.warning(
+                    f"Could not prune render cache file {path}: {error}"
+                )
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from utils import compositing
+
+
+class RenderTimeout(Exception):
+    pass
+
+
+class RenderExecutor:
+    """
+    Runs Pillow compositing jobs off the event loop. Jobs are module-level
+    functions from utils.compositing that take bytes and return picklable
+    results, so they can be shipped to a process pool. Falls back to a thread pool if processes can't
+    be spawned on this host.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        timeout: float = 30.0,
+        use_processes: bool = True,
+    ):
+        self.logger = logging.getLogger("bot")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.use_processes = use_processes
+        self.executor: Optional[Executor] = None
+        self.kind = "none"
+        self.start_lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls) -> "RenderExecutor":
+        workers = os.getenv("RENDER_WORKERS")
+        return cls(
+            max_workers=int(workers) if workers else None,
+            timeout=float(os.getenv("RENDER_TIMEOUT", "30")),
+            use_processes=os.getenv("RENDER_USE_PROCESSES", "true").lower() != "false",
+        )
+
+    async def start(self) -> None:
+        # Jobs that find no pool all land here; only the first builds one
+        async with self.start_lock:
+            if self.executor is None:
+                await self.create_executor()
+
+    async def create_executor(self) -> None:
+        if self.use_processes:
+            pool = None
+            try:
+                pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers, initializer=compositing.init_worker
+                )
+                # Workers are spawned lazily, so make one round trip to find out now
+                await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(pool, compositing.ping),
+                    timeout=self.timeout,
+                )
+                self.executor = pool
+                self.kind = "process"
+                self.logger.info("Render executor started with a process pool")
+                return
+            except (
+                OSError,
+                NotImplementedError,
+                PermissionError,
+                BrokenProcessPool,
+                asyncio.TimeoutError,
+            ) as error:
+                self.logger.warning(
+                    f"Process pool unavailable, falling back to threads: {error}"
+                )
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix="render",
+            initializer=compositing.init_worker,
+        )
+        self.kind = "thread"
+        self.logger.info("Render executor started with a thread pool")
+
+    async def run(self, job: Callable, *args, timeout: Optional[float] = None) -> Any:
+        if self.executor is None:
+            await self.start()
+        executor = self.executor
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(
+                loop.run_in_executor(executor, job, *args),
+                timeout=timeout or self.timeout,
+            )
+        except asyncio.TimeoutError:
+            # A thread can't be stopped, so a timed-out thread job still runs to
+            # completion. A process can: kill the pool so the stuck worker stops
+            # holding a slot, and start a fresh one for later jobs.
+            if isinstance(executor, ProcessPoolExecutor):
+                self.retire(executor, f"render job {job.__name__} timed out")
+            raise RenderTimeout(
+                f"Render job {job.__name__} exceeded {timeout or self.timeout}s"
+            )
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge avatar), or a timeout retired the
+            # pool under this job
+            self.retire(executor, "render process pool broke")
+            raise
+
+    def retire(self, executor: Executor, reason: str) -> None:
+        # Every job on a failed pool ends up here, so only the first retires it
+        if self.executor is not executor:
+            return
+        self.logger.error(f"Restarting render pool: {reason}")
+        self.executor = None
+        terminate = getattr(executor, "terminate_workers", None)
+        if terminate is not None:
+            terminate()
+            return
+        # shutdown() leaves running jobs alone and forgets its workers, so grab
+        # them first and stop them ourselves
+        processes = list((getattr(executor, "_processes", None) or {}).values())
+        executor.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.terminate()
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
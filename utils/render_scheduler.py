@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class RenderBusy(Exception):
+    pass
+
+
+class RenderScheduler:
+    """
+    Admission control in front of the render executor. Caps how many renders
+    run at once overall and per user, keeps a bounded queue behind that (full
+    queue -> RenderBusy), and dedupes in flight: a request whose key is already
+    rendering waits on the same future instead of rendering again.
+    """
+
+    def __init__(self, max_concurrent: int = 2, per_user: int = 1, max_queue: int = 8):
+        self.logger = logging.getLogger("bot")
+        self.max_concurrent = max_concurrent
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.in_flight: Dict[Hashable, asyncio.Future] = {}
+        self.user_active: Dict[int, int] = {}
+        self.waiting = 0
+        self.running = 0
+        self.submitted = 0
+        self.rejected = 0
+        self.deduped = 0
+        self.wait_times = deque(maxlen=100)
+
+    @classmethod
+    def from_env(cls) -> "RenderScheduler":
+        return cls(
+            max_concurrent=int(os.getenv("RENDER_MAX_CONCURRENT", "2")),
+            per_user=int(os.getenv("RENDER_MAX_PER_USER", "1")),
+            max_queue=int(os.getenv("RENDER_QUEUE_SIZE", "8")),
+        )
+
+    async def submit(
+        self, key: Hashable, user_id: int, render: Callable[[], Awaitable[T]]
+    ) -> T:
+        shared = self.in_flight.get(key)
+        if shared is not None:
+            self.deduped += 1
+            return await asyncio.shield(shared)
+
+        if self.user_active.get(user_id, 0) >= self.per_user:
+            self.rejected += 1
+            raise RenderBusy("You already have a render in progress.")
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RenderBusy("The render queue is full, try again in a bit.")
+
+        self.submitted += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        self.user_active[user_id] = self.user_active.get(user_id, 0) + 1
+        try:
+            start = time.monotonic()
+            self.waiting += 1
+            try:
+                await self.slots.acquire()
+            finally:
+                self.waiting -= 1
+            self.wait_times.append(time.monotonic() - start)
+            self.running += 1
+            try:
+                result = await render()
+            finally:
+                self.running -= 1
+                self.slots.release()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            future.exception()  # mark retrieved when nobody else was waiting
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+            self.user_active[user_id] -= 1
+            if self.user_active[user_id] == 0:
+                del self.user_active[user_id]
+
+    def stats(self) -> Dict[str, float]:
+        waits = self.wait_times
+        return {
+            "queue_depth": self.waiting,
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "deduped": self.deduped,
+            "avg_wait_ms": round(1000 * sum(waits) / len(waits)) if waits else 0,
+            "max_wait_ms": round(1000 * max(waits)) if waits else 0,
+        }
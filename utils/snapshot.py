@@ -0,0 +1,107 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+SHARDS = 32
+
+
+class FrozenMap(Mapping):
+    """
+    Immutable mapping split over a fixed number of hash shards. `set` and
+    `delete` return a new FrozenMap that copies only the shard holding the
+    key and shares every other shard (and every value) with the original.
+    """
+
+    __slots__ = ("shards", "size")
+
+    def __init__(self, data: Optional[Dict[Any, Any]] = None):
+        shards = [{} for _ in range(SHARDS)]
+        for key, value in (data or {}).items():
+            shards[hash(key) % SHARDS][key] = value
+        self.shards: Tuple[Dict[Any, Any], ...] = tuple(shards)
+        self.size = len(data or ())
+
+    @classmethod
+    def _from_shards(cls, shards: Tuple[dict, ...], size: int) -> "FrozenMap":
+        frozen = cls.__new__(cls)
+        frozen.shards = shards
+        frozen.size = size
+        return frozen
+
+    def __getitem__(self, key: Any) -> Any:
+        return self.shards[hash(key) % SHARDS][key]
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self.shards[hash(key) % SHARDS]
+
+    def __iter__(self) -> Iterator[Any]:
+        for shard in self.shards:
+            yield from shard
+
+    def __len__(self) -> int:
+        return self.size
+
+    def update(
+        self, changes: Iterable[Tuple[Any, Any]], deletes: Iterable[Any] = ()
+    ) -> "FrozenMap":
+        shards = list(self.shards)
+        copied = set()
+        size = self.size
+
+        def shard_for(key):
+            idx = hash(key) % SHARDS
+            if idx not in copied:
+                shards[idx] = dict(shards[idx])
+                copied.add(idx)
+            return shards[idx]
+
+        for key, value in changes:
+            shard = shard_for(key)
+            size += key not in shard
+            shard[key] = value
+        for key in deletes:
+            shard = shard_for(key)
+            if key in shard:
+                del shard[key]
+                size -= 1
+        return self._from_shards(tuple(shards), size)
+
+    def set(self, key: Any, value: Any) -> "FrozenMap":
+        return self.update([(key, value)])
+
+    def delete(self, key: Any) -> "FrozenMap":
+        return self.update((), [key])
+
+
+class Snapshot(NamedTuple):
+    version: int
+    data: FrozenMap
+
+
+class VersionedMap:
+    """
+    Holds the current Snapshot. Readers take `current` and can iterate it for
+    as long as they like; writers build the next FrozenMap and swap it in with
+    a bumped version, which caches can key on.
+    """
+
+    def __init__(self, data: Optional[Dict[Any, Any]] = None):
+        self.current = Snapshot(0, FrozenMap(data))
+
+    @property
+    def version(self) -> int:
+        return self.current.version
+
+    def set(self, key: Any, value: Any) -> Snapshot:
+        return self.swap(self.current.data.set(key, value))
+
+    def delete(self, key: Any) -> Snapshot:
+        return self.swap(self.current.data.delete(key))
+
+    def update(
+        self, changes: Iterable[Tuple[Any, Any]], deletes: Iterable[Any] = ()
+    ) -> Snapshot:
+        return self.swap(self.current.data.update(changes, deletes))
+
+    def swap(self, data: FrozenMap) -> Snapshot:
+        self.current = Snapshot(self.current.version + 1, data)
+        return self.current
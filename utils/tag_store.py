@@ -0,0 +1,202 @@
+import asyncio
+import base64
+import logging
+import os
+from bisect import bisect_left, insort
+from typing import Dict, List, NamedTuple, Optional
+
+import redis.asyncio as redis
+
+from utils.autocomplete import AutocompleteIndex
+from utils.json_db import load_json_db, open_store
+
+TAG_KEY = "tag:{}"
+TAG_INDEX = "tags"
+TAG_CHANNEL = "tags:invalidate"
+# Set once the file tags have been imported; the index itself can't serve as
+# the marker because Redis drops a sorted set when its last member goes
+TAG_IMPORTED = "tags:imported"
+
+
+class Tag(NamedTuple):
+    data: str
+    author: str
+    creation: str
+
+
+class FileTagStore:
+    """Tags in the TAG_JSON_PATH file, with tag text base64 encoded as before."""
+
+    def __init__(self, path: str):
+        self.store = open_store(path)
+        self.index = AutocompleteIndex(self.store)
+
+    def names(self) -> List[str]:
+        return list(self.store)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.store
+
+    async def get(self, name: str) -> Optional[Tag]:
+        entry = self.store.get(name)
+        if entry is None:
+            return None
+        data = base64.b64decode(entry["data"].encode("utf-8")).decode("utf-8")
+        return Tag(data, entry["author"], entry["creation"])
+
+    async def add(self, name: str, tag: Tag) -> None:
+        data = base64.b64encode(tag.data.encode("utf-8")).decode("utf-8")
+        self.store.set(
+            name, {"data": data, "author": tag.author, "creation": tag.creation}
+        )
+        self.index.add(name)
+
+    async def remove(self, name: str) -> bool:
+        self.index.remove(name)
+        return self.store.delete(name) is not None
+
+    async def close(self) -> None:
+        await self.store.close()
+
+
+class RedisTagStore:
+    """
+    Tags in Redis, shared by every bot instance: one hash per tag holding raw
+    UTF-8 text, plus a sorted set of names. Each instance keeps the name list
+    and a read-through cache of tag bodies locally; writers publish the
+    changed name and every instance (the writer included) drops that entry
+    and updates its name list.
+    """
+
+    def __init__(self, client: redis.Redis):
+        self.logger = logging.getLogger("bot")
+        self.client = client
+        self.sorted_names: List[str] = []
+        self.cache: Dict[str, Tag] = {}
+        self.index = AutocompleteIndex()
+        self.listener: Optional[asyncio.Task] = None
+
+    async def start(self, json_path: Optional[str] = None) -> None:
+        if json_path and not await self.client.exists(TAG_IMPORTED):
+            # Instances migrated before the marker existed already have tags
+            if not await self.client.exists(TAG_INDEX):
+                await self.import_json(json_path)
+            await self.client.set(TAG_IMPORTED, 1)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(TAG_CHANNEL)
+        await self.reload()
+        self.listener = asyncio.create_task(self.listen())
+
+    async def close(self) -> None:
+        if self.listener is not None:
+            self.listener.cancel()
+            self.listener = None
+        await self.pubsub.aclose()
+
+    async def reload(self) -> None:
+        self.sorted_names = await self.client.zrange(TAG_INDEX, 0, -1)
+        self.cache.clear()
+        uses = self.index.uses
+        self.index = AutocompleteIndex(self.sorted_names)
+        self.index.uses.update(
+            {name: n for name, n in uses.items() if name in self.index}
+        )
+
+    async def import_json(self, json_path: str) -> None:
+        """Copies the file tags into Redis; start() runs this once per database."""
+        if not os.path.exists(json_path):
+            return
+        try:
+            tags = await asyncio.to_thread(load_json_db, json_path)
+        except ValueError:
+            return
+        async with self.client.pipeline(transaction=True) as pipe:
+            for name, entry in tags.items():
+                data = base64.b64decode(entry["data"].encode("utf-8")).decode("utf-8")
+                pipe.hset(
+                    TAG_KEY.format(name),
+                    mapping={
+                        "data": data,
+                        "author": entry["author"],
+                        "creation": entry["creation"],
+                    },
+                )
+                pipe.zadd(TAG_INDEX, {name: 0})
+            await pipe.execute()
+        self.logger.info(f"Imported {len(tags)} tags from {json_path} into Redis")
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async for message in self.pubsub.listen():
+                    if message["type"] == "message":
+                        await self.invalidate(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                # Changes may have been missed while disconnected, so start over
+                self.logger.warning(f"Tag invalidation listener failed: {error}")
+                await asyncio.sleep(5)
+                try:
+                    await self.pubsub.subscribe(TAG_CHANNEL)
+                    await self.reload()
+                except Exception as retry_error:
+                    self.logger.warning(f"Tag store reload failed: {retry_error}")
+
+    async def invalidate(self, name: str) -> None:
+        self.cache.pop(name, None)
+        exists = await self.client.zscore(TAG_INDEX, name) is not None
+        idx = bisect_left(self.sorted_names, name)
+        present = idx < len(self.sorted_names) and self.sorted_names[idx] == name
+        if exists and not present:
+            insort(self.sorted_names, name)
+            self.index.add(name)
+        elif present and not exists:
+            del self.sorted_names[idx]
+            self.index.remove(name)
+
+    def names(self) -> List[str]:
+        return self.sorted_names
+
+    def __contains__(self, name: str) -> bool:
+        idx = bisect_left(self.sorted_names, name)
+        return idx < len(self.sorted_names) and self.sorted_names[idx] == name
+
+    async def get(self, name: str) -> Optional[Tag]:
+        tag = self.cache.get(name)
+        if tag is not None:
+            return tag
+        fields = await self.client.hgetall(TAG_KEY.format(name))
+        if not fields:
+            return None
+        tag = self.cache[name] = Tag(
+            fields["data"], fields["author"], fields["creation"]
+        )
+        return tag
+
+    async def add(self, name: str, tag: Tag) -> None:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.hset(TAG_KEY.format(name), mapping=tag._asdict())
+            pipe.zadd(TAG_INDEX, {name: 0})
+            pipe.publish(TAG_CHANNEL, name)
+            await pipe.execute()
+        await self.invalidate(name)
+
+    async def remove(self, name: str) -> bool:
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.delete(TAG_KEY.format(name))
+            pipe.zrem(TAG_INDEX, name)
+            pipe.publish(TAG_CHANNEL, name)
+            deleted, _, _ = await pipe.execute()
+        await self.invalidate(name)
+        return bool(deleted)
+
+
+async def open_tag_store(client: redis.Redis):
+    """The tag store selected by TAG_STORAGE ("file" or "redis")."""
+    json_path = os.getenv("TAG_JSON_PATH")
+    if os.getenv("TAG_STORAGE", "file").lower() == "redis":
+        store = RedisTagStore(client)
+        await store.start(json_path)
+        return store
+    return FileTagStore(json_path)
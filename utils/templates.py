@@ -0,0 +1,37 @@
+import logging
+from typing import Dict, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+
+class TemplateRegistry:
+    """
+    Decodes each meme base image once and keeps it in memory as RGBA.
+    Callers read `templates[name]` directly and must treat it as read-only;
+    the compositor only crops and pastes from it.
+    """
+
+    def __init__(self, paths: Dict[str, str]):
+        self.logger = logging.getLogger("bot")
+        self.templates: Dict[str, Image.Image] = {}
+        for name, path in paths.items():
+            self.load(name, path)
+
+    def load(self, name: str, path: str) -> None:
+        with Image.open(path) as im:
+            self.templates[name] = im.convert("RGBA")
+        self.logger.debug(f"Loaded template {name} from {path}")
+
+
+def render_text_layer(
+    size: Tuple[int, int],
+    xy: Tuple[int, int],
+    text: str,
+    font: ImageFont.ImageFont,
+    fill: str = "#000000",
+) -> Image.Image:
+    # Transparent overlay drawn once per request, then composited onto every frame
+    layer = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(layer)
+    draw.text(xy, text, font=font, fill=fill)
+    return layer
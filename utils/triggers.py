@@ -0,0 +1,175 @@
+import json
+import logging
+import os
+from collections import deque
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+NORMALIZERS: Dict[str, Callable[[str], str]] = {
+    "raw": lambda content: content,
+    "lower": str.lower,
+    "nospace": lambda content: content.replace(" ", ""),
+}
+
+
+class Trigger(NamedTuple):
+    name: str
+    match: str
+    kind: str  # "exact" or "contains"
+    normalize: str
+    action: str
+    response: Optional[str]
+    authors: FrozenSet[int]  # empty means anyone
+    chance: float
+
+    @classmethod
+    def from_dict(cls, rule: dict) -> "Trigger":
+        kind = rule.get("kind", "exact")
+        if kind not in ("exact", "contains"):
+            raise ValueError(f"Unknown trigger kind {kind!r} in rule {rule!r}")
+        # Substring rules always match against lowercased content
+        normalize = rule.get("normalize", "lower") if kind == "exact" else "lower"
+        if normalize not in NORMALIZERS:
+            raise ValueError(f"Unknown normalizer {normalize!r} in rule {rule!r}")
+        return cls(
+            name=rule.get("name", rule["action"]),
+            match=NORMALIZERS[normalize](rule["match"]),
+            kind=kind,
+            normalize=normalize,
+            action=rule["action"],
+            response=rule.get("response"),
+            authors=frozenset(int(a) for a in rule.get("authors", ())),
+            chance=float(rule.get("chance", 1.0)),
+        )
+
+    def allows(self, author_id: int) -> bool:
+        return not self.authors or author_id in self.authors
+
+
+class SubstringMatcher:
+    """
+    Aho-Corasick automaton: finds every pattern occurring in a text in one
+    pass, however many patterns there are.
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[FrozenSet[str]] = [frozenset()]
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                nxt = self.goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self.goto)
+                    self.goto[state][char] = nxt
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(frozenset())
+                state = nxt
+            self.out[state] = self.out[state] | {pattern}
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[nxt] = self.goto[fallback].get(char, 0)
+                self.out[nxt] = self.out[nxt] | self.out[self.fail[nxt]]
+
+    def search(self, text: str) -> FrozenSet[str]:
+        found = frozenset()
+        goto, fail, out = self.goto, self.fail, self.out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+
+class TriggerRouter:
+    """
+    Compiled form of the trigger rules. Exact rules become one dict per
+    normalizer, substring rules share one automaton, and the automaton is only
+    run when the author could match at least one substring rule.
+    """
+
+    def __init__(self, triggers: List[Trigger]):
+        self.triggers = triggers
+        self.exact: Dict[str, Dict[str, List[Trigger]]] = {}
+        self.contains: Dict[str, List[Trigger]] = {}
+        for trigger in triggers:
+            if trigger.kind == "exact":
+                table = self.exact.setdefault(trigger.normalize, {})
+                table.setdefault(trigger.match, []).append(trigger)
+            else:
+                self.contains.setdefault(trigger.match, []).append(trigger)
+
+        substring_rules = [t for c in self.contains.values() for t in c]
+        self.contains_anyone = any(not t.authors for t in substring_rules)
+        self.contains_authors = frozenset().union(*(t.authors for t in substring_rules))
+        self.matcher = SubstringMatcher(self.contains) if self.contains else None
+
+    @classmethod
+    def from_file(cls, path: str) -> "TriggerRouter":
+        with open(path, "r", encoding="utf-8") as fp:
+            rules = json.load(fp)["rules"]
+        return cls([Trigger.from_dict(rule) for rule in rules])
+
+    def match(self, author_id: int, content: str) -> List[Trigger]:
+        """Triggers fired by a message, in rule file order."""
+        hits = []
+        for normalize, table in self.exact.items():
+            hits.extend(table.get(NORMALIZERS[normalize](content), ()))
+        if self.matcher is not None and (
+            self.contains_anyone or author_id in self.contains_authors
+        ):
+            for pattern in self.matcher.search(content.lower()):
+                hits.extend(self.contains[pattern])
+        hits = [t for t in hits if t.allows(author_id)]
+        if len(hits) > 1:
+            order = {id(t): i for i, t in enumerate(self.triggers)}
+            hits.sort(key=lambda t: order[id(t)])
+        return hits
+
+
+class TriggerRules:
+    """
+    Owns the router for a rules file and swaps in a freshly compiled one when
+    the file's mtime changes. A file that fails to compile is logged and the
+    previous router kept.
+    """
+
+    def __init__(self, path: str):
+        self.logger = logging.getLogger("bot")
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.router = TriggerRouter.from_file(path)
+
+    @classmethod
+    def from_env(cls) -> "TriggerRules":
+        return cls(os.getenv("TRIGGERS_PATH", "data/triggers.json"))
+
+    def reload_if_changed(self) -> bool:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError as error:
+            self.logger.warning(f"Trigger rules unavailable: {error}")
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime
+        try:
+            self.router = TriggerRouter.from_file(self.path)
+        except (OSError, ValueError, KeyError) as error:
+            self.logger.error(f"Keeping previous trigger rules, reload failed: {error}")
+            return False
+        self.logger.info(
+            f"Reloaded {len(self.router.triggers)} trigger rules from {self.path}"
+        )
+        return True